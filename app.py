@@ -1,28 +1,44 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from models import db, User, Chat, Message
+from flask_migrate import Migrate
+from sqlalchemy import and_, or_
+from models import db, User, Chat, Message, configure_sqlite
 from forms import RegistrationForm, LoginForm
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
+from embeddings import encode_chunks, load_embedder, backend_name
+from embedding_cache import EmbeddingCache
+from embed_server import EmbeddingClient
+from vector_store import get_chat_index, update_documents, drop_chat_index, ChunkSpool, IndexPolicy, set_policy
+from ingest import IngestPipeline
+from query_cache import QueryCache
+from response_cache import ResponseCache
+from llm_client import LLMClient
+from context_builder import ContextBuilder
+from summarizer import Summarizer, SummaryStore, sample_positions
+from parsers import DocumentParser
+from renderer import Renderer, render
+from chunking import TokenChunker
+from metrics import registry, span, record, server_timing, TOKEN_BUCKETS
 import os
 import shutil
 from werkzeug.utils import secure_filename
 import json
+import hashlib
+import copy
+import functools
+import threading
+import time
 from datetime import datetime
 import requests
-import PyPDF2
-import docx
-import pandas as pd
-import re
-from pptx import Presentation
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
 
 db.init_app(app)
+migrate = Migrate(app, db)  # flask db upgrade applies migrations/
+with app.app_context():
+    configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -32,117 +48,235 @@ ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024 * 1024  # 1 GB
 
-documents = []
-
+def lazy(factory):
+    # Runs `factory` on first call only, even with several threads calling
+    # at once, and returns the same result from then on. Keeps importing the
+    # app cheap: the model, torch and friends load when first needed.
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(factory)
+    def get():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(factory())
+        return result[0]
+    return get
+
+@lazy
 def init_db():
     with app.app_context():
         db.create_all()
 
-init_db()
-
-# Initialize the sentence transformer model
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-# Create a FAISS index for vector search
-index = None
-doc_embeddings = []
-doc_metadata = []  # To store metadata like filenames or doc IDs
+@app.before_request
+def ensure_db():
+    init_db()
+
+HTTP_SECONDS = registry.histogram('rag_http_request_seconds', 'Time to respond to a request', ['endpoint', 'status'])
+
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    if app.config['REQUEST_PROFILING'] and (request.args.get('profile') or request.headers.get('X-Profile')):
+        registry.start_profile()
+
+@app.after_request
+def finish_timing(response):
+    # For a streamed answer this is the time to the first byte; its stages
+    # come in the done event instead
+    if 'request_start' in g:
+        HTTP_SECONDS.observe(time.perf_counter() - g.request_start,
+                             endpoint=request.endpoint or 'unknown', status=response.status_code)
+    profile = registry.end_profile()
+    if profile:
+        response.headers['Server-Timing'] = server_timing(profile)
+    return response
 
+# Initialize the embedding model on the configured backend
+def load_model():
+    return load_embedder(app.config['EMBEDDING_MODEL'], app.config['EMBEDDING_BACKEND'],
+                         quantize=app.config['EMBED_QUANTIZE'], cache_dir=app.config['EMBED_ONNX_DIR'],
+                         threads=app.config['EMBED_THREADS'])
+
+def load_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(app.config['EMBEDDING_MODEL'])
+
+@lazy
+def get_model():
+    if app.config['EMBED_SERVER_URL']:
+        # Encoding goes to the shared embedding server (see embed_server.py), so
+        # this worker only loads the tokenizer unless it has to fall back
+        return EmbeddingClient(app.config['EMBED_SERVER_URL'], load_model, load_tokenizer,
+                               timeout=app.config['EMBED_SERVER_TIMEOUT'])
+    return load_model()
+
+# Chunks seen in any chat are embedded once and reused from this cache
+@lazy
+def get_embedding_cache():
+    if not app.config['EMBED_CACHE_DIR']:
+        return None
+    name = backend_name(app.config['EMBEDDING_MODEL'], app.config['EMBEDDING_BACKEND'], app.config['EMBED_QUANTIZE'])
+    return EmbeddingCache(app.config['EMBED_CACHE_DIR'], name,
+                          get_model().get_sentence_embedding_dimension(),
+                          max_entries=app.config['EMBED_CACHE_MAX_ENTRIES'])
+
+# Chunks are packed up to the model's real sequence length (minus [CLS]/[SEP]);
+# the chunker gets its own tokenizer copy so it never races the model's
+@lazy
+def get_chunker():
+    model = get_model()
+    return TokenChunker(copy.deepcopy(model.tokenizer),
+                        max_tokens=app.config['CHUNK_MAX_TOKENS'] or model.max_seq_length - 2,
+                        overlap_tokens=app.config['CHUNK_OVERLAP_TOKENS'])
+
+def count_tokens(texts):
+    return get_chunker().count_tokens(texts)
+
+def warm_up():
+    # Loads everything the first upload or question would otherwise wait for
+    init_db()
+    get_model().encode(['warm up'])
+    get_chunker()
+    get_embedding_cache()
+    import faiss  # noqa: F401 -- its first import alone takes a noticeable moment
+
+# Text extraction fans out over a process pool, per file and per PDF page range
+document_parser = DocumentParser(max_workers=app.config['PARSER_WORKERS'],
+                                 pdf_pages_per_task=app.config['PDF_PAGES_PER_TASK'])
+
+context_builder = ContextBuilder(count_tokens, token_budget=app.config['PROMPT_TOKEN_BUDGET'],
+                                 dedup_similarity=app.config['CONTEXT_DEDUP_SIMILARITY'])
+
+llm_client = LLMClient(app.config['LLAMA_ENDPOINT'], app.config['LLAMA_MODEL'],
+                       timeout=app.config['LLAMA_TIMEOUT'],
+                       connect_timeout=app.config['LLAMA_CONNECT_TIMEOUT'],
+                       max_concurrency=app.config['LLAMA_MAX_CONCURRENCY'],
+                       queue_timeout=app.config['LLAMA_QUEUE_TIMEOUT'],
+                       retries=app.config['LLAMA_RETRIES'],
+                       backoff=app.config['LLAMA_BACKOFF'])
+
+summarizer = Summarizer(llm_client.generate, SummaryStore(app.config['SUMMARY_DB']), app.config['LLAMA_MODEL'],
+                        sample_chunks=app.config['SUMMARY_SAMPLE_CHUNKS'],
+                        max_workers=app.config['SUMMARY_WORKERS'])
+
+query_cache = QueryCache(maxsize=app.config['QUERY_CACHE_SIZE'], ttl=app.config['QUERY_CACHE_TTL'])
+response_cache = None
+if app.config['RESPONSE_CACHE_PATH']:
+    response_cache = ResponseCache(app.config['RESPONSE_CACHE_PATH'],
+                                   max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+                                   similarity=app.config['RESPONSE_CACHE_SIMILARITY'])
+
+PROMPT_TOKENS = registry.histogram('rag_prompt_tokens', 'Prompt size in embedding-tokenizer tokens',
+                                   buckets=TOKEN_BUCKETS)
+ANSWERS = registry.counter('rag_answers_total', 'Answers by where they came from', ['source'])
+
+def cache_metrics():
+    stats = query_cache.stats()
+    caches = [('query_embeddings', stats['query_embeddings']), ('retrieval_results', stats['retrieval_results'])]
+    if response_cache is not None:
+        caches.append(('responses', response_cache.stats()))
+    return [
+        ('rag_cache_hits_total', 'counter', 'Cache lookups that hit',
+         [({'cache': name}, cache['hits']) for name, cache in caches]),
+        ('rag_cache_misses_total', 'counter', 'Cache lookups that missed',
+         [({'cache': name}, cache['misses']) for name, cache in caches]),
+    ]
+
+def llm_metrics():
+    stats = llm_client.stats()
+    return [
+        ('rag_llm_in_flight', 'gauge', 'Generations running', [({}, stats['in_flight'])]),
+        ('rag_llm_queued', 'gauge', 'Generations waiting for a slot', [({}, stats['queued'])]),
+        ('rag_llm_requests_total', 'counter', 'Generation requests', [({}, stats['requests'])]),
+        ('rag_llm_errors_total', 'counter', 'Generations that failed', [({}, stats['errors'])]),
+        ('rag_llm_retries_total', 'counter', 'Generation attempts retried', [({}, stats['retries'])]),
+        ('rag_llm_rejected_total', 'counter', 'Generations that timed out waiting for a slot',
+         [({}, stats['rejected'])]),
+    ]
+
+registry.collector(cache_metrics)
+registry.collector(llm_metrics)
+
+set_policy(IndexPolicy(ivf_threshold=app.config['INDEX_IVF_THRESHOLD'],
+                       pq_threshold=app.config['INDEX_PQ_THRESHOLD'],
+                       nprobe=app.config['INDEX_NPROBE'], pq_m=app.config['INDEX_PQ_M'],
+                       storage=app.config['VECTOR_STORAGE']))
+
+
+def chat_index_dir(chat_id):
+    # Each chat keeps its FAISS index and chunk metadata next to its uploads
+    return os.path.join(app.config['UPLOAD_FOLDER'], str(chat_id), '.index')
+
+def discard_documents(chat_id):
+    # Deletes a chat's uploads and index and forgets anything cached from them
+    uploads_dir = os.path.join(app.config['UPLOAD_FOLDER'], str(chat_id))
+    if os.path.exists(uploads_dir):
+        shutil.rmtree(uploads_dir)
+    drop_chat_index(chat_index_dir(chat_id))
+    query_cache.drop(chat_index_dir(chat_id))
+    if response_cache is not None:
+        response_cache.drop_chat(chat_id)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
-
-def process_document(file_path):
-    _, file_extension = os.path.splitext(file_path)
-    
-    if file_extension == '.pdf':
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-    elif file_extension in ['.doc', '.docx']:
-        doc = docx.Document(file_path)
-        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-    elif file_extension in ['.xls', '.xlsx']:
-        df = pd.read_excel(file_path)
-        text = df.to_string()
-    elif file_extension in ['.ppt', '.pptx']:
-        prs = Presentation(file_path)
-        text = ""
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, 'text'):
-                    text += shape.text + "\n"
-    elif file_extension == '.txt':
-        with open(file_path, 'r') as file:
-            text = file.read()
-    else:
-        text = ""
-    
-    # Chunk the text
-    text_chunks = chunk_text(text)
-    
-    # Generate embeddings for each chunk
-    embeddings = [model.encode([chunk])[0] for chunk in text_chunks]
-    
-    return text_chunks, embeddings
-
-def summarize_document(text, filename):
-    prompt = f"Look at the entire document, no matter how large it is, and summarize it in 3-5 sentences:\n\n{text[:1000]}..."  # Limit text to prevent token overflow
-    response = requests.post('http://localhost:11434/api/generate',
-                             json={
-                                 "model": "llama3.1",
-                                 "prompt": prompt,
-                                 "stream": False
-                             })
-    summary = response.json()['response']
-    return filename, summary
-
-def process_response(response):
-    # Convert numbered lists
-    response = re.sub(r'(\d+\.\s*.*?)(?=\n\d+\.|\Z)', r'<li>\1</li>', response, flags=re.DOTALL)
-    response = re.sub(r'((?:<li>.*?</li>\n*)+)', r'<ol>\1</ol>', response, flags=re.DOTALL)
-    
-    # Convert bullet point lists
-    response = re.sub(r'(•\s*.*?)(?=\n•|\Z)', r'<li>\1</li>', response, flags=re.DOTALL)
-    response = re.sub(r'((?:<li>.*?</li>\n*)+)', r'<ul>\1</ul>', response, flags=re.DOTALL)
-    
-    # Convert tables
-    def table_replace(match):
-        rows = match.group(1).split('\n')
-        table_html = '<table class="border-collapse border border-gray-400 w-full">'
-        for i, row in enumerate(rows):
-            cells = row.split('|')
-            table_html += '<tr>'
-            for cell in cells:
-                tag = 'th' if i == 0 else 'td'
-                table_html += f'<{tag} class="border border-gray-400 px-4 py-2">{cell.strip()}</{tag}>'
-            table_html += '</tr>'
-        table_html += '</table>'
-        return table_html
-    
-    response = re.sub(r'\n((?:[^|\n]+\|)+[^|\n]+(?:\n(?:[^|\n]+\|)+[^|\n]+)*)', table_replace, response)
-    
-    # Convert markdown-style bold to HTML bold
-    response = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', response)
-    
-    # Convert markdown-style italic to HTML italic
-    response = re.sub(r'\*(.*?)\*', r'<em>\1</em>', response)
-    
-    # Convert newlines to <br> tags, except within HTML tags
-    response = re.sub(r'(?<!>)\n(?!<)', '<br>', response)
-    
-    return response
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_uploads(chat_id, files):
+    # Yields (filename, doc) in upload order while the parser pool works
+    # ahead; doc is None for an unchanged re-upload, which keeps its
+    # existing vectors, and carries a lazy `segments` iterator otherwise.
+    chat_index = get_chat_index(chat_index_dir(chat_id))
+    changed = {}
+    for filename, file_path in files:
+        sha256 = file_sha256(file_path)
+        indexed = chat_index.find_file(filename) if chat_index is not None else None
+        if indexed is None or indexed['sha256'] != sha256:
+            changed[file_path] = sha256
+    parsed = document_parser.iter_parse(list(changed))
+    for filename, file_path in files:
+        if file_path not in changed:
+            yield filename, None
+            continue
+        _, segments = next(parsed)
+        yield filename, {'filename': filename, 'sha256': changed[file_path], 'segments': segments}
+
+def embed_upload(chunks):
+    return encode_chunks(get_model(), chunks, batch_size=app.config['EMBED_BATCH_SIZE'], cache=get_embedding_cache())
+
+def chunk_upload(segments):
+    return get_chunker().iter_chunks(segments)
+
+def summarize_upload(doc):
+    # Sample chunks from across the whole document before its spool is discarded
+    spool = doc['spool']
+    if spool.count == 0:
+        return
+    summarizer.submit(doc['sha256'], doc['filename'],
+                      spool.texts(sample_positions(spool.count, app.config['SUMMARY_SAMPLE_CHUNKS'])))
+
+def spool_upload(chat_id):
+    return ChunkSpool(chat_index_dir(chat_id))
+
+def index_upload(chat_id, doc):
+    update_documents(chat_index_dir(chat_id), add=[doc])
+
+ingest_pipeline = IngestPipeline(os.path.join(UPLOAD_FOLDER, '.jobs'), parse_uploads, chunk_upload, embed_upload,
+                                 summarize_upload, spool_upload, index_upload,
+                                 batch_size=app.config['EMBED_BATCH_SIZE'],
+                                 max_workers=app.config['INGEST_WORKERS'])
+
+# Pages like login never touch the model; with WARMUP_ON_START it still loads
+# in the background at boot so the first question doesn't wait for it
+if app.config['WARMUP_ON_START']:
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -196,8 +330,15 @@ def logout():
 @app.route("/home")
 @login_required
 def home():
-    chats = Chat.query.filter_by(user_id=current_user.id).all()
-    return render_template('home.html', chats=chats)
+    # Newest chats first, a page at a time; ?before=<chat id> pages back
+    query = Chat.query.filter_by(user_id=current_user.id)
+    before = request.args.get('before', type=int)
+    if before is not None:
+        query = query.filter(Chat.id < before)
+    page_size = app.config['HISTORY_PAGE_SIZE']
+    chats = query.order_by(Chat.id.desc()).limit(page_size + 1).all()
+    next_before = chats[page_size - 1].id if len(chats) > page_size else None
+    return render_template('home.html', chats=chats[:page_size], next_before=next_before)
 
 @app.route("/new_chat", methods=['POST'])
 @login_required
@@ -216,8 +357,93 @@ def new_chat():
 @login_required
 def chat(chat_id):
     chat = Chat.query.get_or_404(chat_id)
-    messages = Message.query.filter_by(chat_id=chat.id).order_by(Message.timestamp).all()
-    return render_template('chat.html', chat=chat, messages=messages)
+    # Only the latest page; older messages are fetched as the user scrolls up
+    messages, next_before = message_page(chat.id, None, app.config['HISTORY_PAGE_SIZE'])
+    return render_template('chat.html', chat=chat, messages=messages, next_before=next_before)
+
+def message_page(chat_id, before, limit):
+    # Keyset pagination over the (chat_id, timestamp) index: up to `limit`
+    # messages older than message `before` (or the latest ones), oldest
+    # first, plus the cursor for the page before them (None at the start).
+    # The cost doesn't grow with how far back the page is.
+    query = Message.query.filter_by(chat_id=chat_id)
+    if before is not None:
+        cursor = db.session.get(Message, before)
+        if cursor is None or cursor.chat_id != chat_id:
+            return [], None
+        query = query.filter(or_(Message.timestamp < cursor.timestamp,
+                                 and_(Message.timestamp == cursor.timestamp, Message.id < cursor.id)))
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    next_before = messages[limit - 1].id if len(messages) > limit else None
+    return messages[:limit][::-1], next_before
+
+@app.route("/chat/<int:chat_id>/messages")
+@login_required
+def chat_messages(chat_id):
+    chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    limit = min(request.args.get('limit', app.config['HISTORY_PAGE_SIZE'], type=int), 200)
+    messages, next_before = message_page(chat.id, request.args.get('before', type=int), max(limit, 1))
+    return jsonify({'messages': [message.to_dict() for message in messages], 'before': next_before})
+
+def build_prompt(chat_id, content):
+    chat_index = get_chat_index(chat_index_dir(chat_id))
+    if chat_index is not None and chat_index.ntotal:
+        # Get top 10 relevant chunks by embedding and BM25; repeated questions skip encoding and search
+        with span('retrieve'):
+            relevant_chunks = query_cache.search(chat_index, content, encode_query, k=10,
+                                                 hybrid=app.config['HYBRID_SEARCH'])
+
+        # Merge, deduplicate and trim the chunks to what fits the prompt budget
+        template = "Context:\n{context}\n\nUser: {content}\n\nAssistant: Based on the provided context, I'll answer the user's question. If the answer is not in the context, I'll say so and provide a general response. Use proper formatting for lists, tables, and other structured content."
+        reserved = count_tokens([template.format(context='', content=content)])[0]
+        with span('build_context'):
+            context, passages, context_tokens = context_builder.build(chat_index, relevant_chunks, reserved)
+        prompt = template.format(context=context, content=content)
+        prompt_tokens = reserved + context_tokens
+
+        # Deduplicate citations without limiting the number
+        citations = list(dict.fromkeys(passage.filename for passage in passages))
+        chunk_ids = [i for passage in passages for i in passage.ids]
+    else:
+        prompt = f"User: {content}\n\nAssistant: Provide a detailed response using proper formatting for lists, tables, and other structured content where appropriate."
+        prompt_tokens = count_tokens([prompt])[0]
+        citations = []
+        chunk_ids = []
+    PROMPT_TOKENS.observe(prompt_tokens)
+    app.logger.info(f"Prompt for chat {chat_id}: {prompt_tokens} tokens, {len(chunk_ids)} chunks")
+    return prompt, citations, chunk_ids, prompt_tokens
+
+def encode_query(query):
+    with span('encode_query'):
+        return get_model().encode([query])
+
+def cached_response(chat_id, content, chunk_ids):
+    # Returns (answer or None, query embedding); the embedding is only
+    # computed when semantic matching is enabled and is reused on store.
+    if response_cache is None:
+        return None, None
+    embedding = query_cache.embed(content, encode_query) if response_cache.semantic else None
+    with span('response_cache'):
+        return response_cache.get(app.config['LLAMA_MODEL'], chat_id, chunk_ids, content, embedding), embedding
+
+def cache_response(chat_id, content, chunk_ids, bot_response, embedding):
+    if response_cache is not None and bot_response:
+        response_cache.put(app.config['LLAMA_MODEL'], chat_id, chunk_ids, content, bot_response, embedding)
+
+def save_exchange(chat_id, content, bot_response, citations, formatted_response=None):
+    # The answer is stored as rendered HTML for display and as the model's
+    # raw text, so it can be rendered again
+    if formatted_response is None:
+        with span('render'):
+            formatted_response = render(bot_response)
+    db.session.add(Message(content=content, is_user=True, chat_id=chat_id))
+    db.session.add(Message(content=formatted_response, raw_content=bot_response, is_user=False, chat_id=chat_id,
+                           citations=json.dumps(citations)))
+    with span('db_commit'):
+        db.session.commit()
+    return formatted_response
 
 @app.route("/send_message", methods=['POST'])
 @login_required
@@ -225,105 +451,193 @@ def send_message():
     data = request.json
     chat_id = data['chat_id']
     content = data['message']
+    chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    user_message = Message(content=content, is_user=True, chat_id=chat_id)
-    db.session.add(user_message)
-    
-    if documents and index is not None:
-        query_embedding = model.encode([content])
-        _, I = index.search(query_embedding, k=10)  # Get top 10 relevant chunks
-
-        relevant_chunks = [doc_metadata[i] for i in I[0]]
-        context = "\n".join([f"Chunk from {doc['filename']}:\n{doc['chunk_text']}" for doc in relevant_chunks])
-        prompt = f"Context:\n{context}\n\nUser: {content}\n\nAssistant: Based on the provided context, I'll answer the user's question. If the answer is not in the context, I'll say so and provide a general response. Use proper formatting for lists, tables, and other structured content."
-        
-        # Deduplicate citations without limiting the number
-        citations = list(dict.fromkeys(doc['filename'] for doc in relevant_chunks))
-    else:
-        prompt = f"User: {content}\n\nAssistant: Provide a detailed response using proper formatting for lists, tables, and other structured content where appropriate."
-        citations = []
+    prompt, citations, chunk_ids, prompt_tokens = build_prompt(chat_id, content)
+    bot_response, query_embedding = cached_response(chat_id, content, chunk_ids)
+    if bot_response is not None:
+        ANSWERS.inc(source='cache')
+        formatted_response = save_exchange(chat_id, content, bot_response, citations)
+        return jsonify({'bot_response': formatted_response, 'citations': citations, 'prompt_tokens': prompt_tokens})
 
     try:
-        response = requests.post(app.config['LLAMA_ENDPOINT'],
-                                 json={
-                                     "model": "llama3.1",
-                                     "prompt": prompt,
-                                     "stream": False
-                                 }, timeout=30)  # 30 second timeout
-        response.raise_for_status()  # Raises an HTTPError for bad responses
-        data = response.json()
-        if 'response' not in data:
-            raise KeyError("'response' key not found in API response")
-        bot_response = data['response']
+        with span('llm_generate'):
+            bot_response = llm_client.generate(prompt)
     except requests.RequestException as e:
         app.logger.error(f"Error calling Llama API: {e}")
+        ANSWERS.inc(source='error')
         return jsonify({'error': 'Failed to communicate with AI model'}), 503
     except KeyError as e:
         app.logger.error(f"Unexpected API response format: {e}")
+        ANSWERS.inc(source='error')
         return jsonify({'error': 'Unexpected response from AI model'}), 500
     except Exception as e:
         app.logger.error(f"Unexpected error in send_message: {e}")
+        ANSWERS.inc(source='error')
         return jsonify({'error': 'An unexpected error occurred'}), 500
     
-    formatted_response = process_response(bot_response)
-    
-    bot_message = Message(content=formatted_response, is_user=False, chat_id=chat_id, citations=json.dumps(citations))
-    db.session.add(bot_message)
+    ANSWERS.inc(source='llm')
+    cache_response(chat_id, content, chunk_ids, bot_response, query_embedding)
+    formatted_response = save_exchange(chat_id, content, bot_response, citations)
     
-    db.session.commit()
-    
-    return jsonify({'bot_response': formatted_response, 'citations': citations})
+    return jsonify({'bot_response': formatted_response, 'citations': citations, 'prompt_tokens': prompt_tokens})
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/send_message_stream", methods=['POST'])
+@login_required
+def send_message_stream():
+    data = request.json
+    chat_id = data['chat_id']
+    content = data['message']
+    chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    prompt, citations, chunk_ids, prompt_tokens = build_prompt(chat_id, content)
+    cached, query_embedding = cached_response(chat_id, content, chunk_ids)
+    # The stages timed so far, when this request is profiled; the generator
+    # runs after the request has returned, so it carries the profile on
+    profile = registry.current_profile()
+
+    def done_event(formatted_response):
+        done = {'bot_response': formatted_response, 'citations': citations, 'prompt_tokens': prompt_tokens}
+        if profile is not None:
+            done['server_timing'] = server_timing(registry.end_profile())
+        return sse_event('done', done)
+
+    def generate():
+        if profile is not None:
+            registry.start_profile(profile)
+        renderer = Renderer()
+        if cached is not None:
+            ANSWERS.inc(source='cache')
+            with span('render'):
+                html = renderer.feed(cached)
+                rest = renderer.close()
+            yield sse_event('token', {'token': cached, 'html': html})
+            formatted_response = save_exchange(chat_id, content, cached, citations, html + rest)
+            yield done_event(formatted_response)
+            return
+
+        # Relay Ollama's NDJSON tokens as server-sent events as they arrive;
+        # the timeout applies between tokens, not to the whole answer. Each
+        # event also carries the HTML of any lines the token completed.
+        # Time spent sending events to the client counts towards llm_stream
+        tokens = []
+        html = []
+        render_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            for token in llm_client.stream(prompt):
+                if not tokens:
+                    record('llm_first_token', time.perf_counter() - start)
+                tokens.append(token)
+                render_start = time.perf_counter()
+                html.append(renderer.feed(token))
+                render_seconds += time.perf_counter() - render_start
+                yield sse_event('token', {'token': token, 'html': html[-1]})
+        except requests.RequestException as e:
+            app.logger.error(f"Error calling Llama API: {e}")
+            ANSWERS.inc(source='error')
+            yield sse_event('error', {'error': 'Failed to communicate with AI model'})
+            return
+        except (KeyError, ValueError) as e:
+            app.logger.error(f"Unexpected API response format: {e}")
+            ANSWERS.inc(source='error')
+            yield sse_event('error', {'error': 'Unexpected response from AI model'})
+            return
+        record('llm_stream', time.perf_counter() - start)
+        ANSWERS.inc(source='llm')
+
+        bot_response = ''.join(tokens)
+        render_start = time.perf_counter()
+        html.append(renderer.close())
+        record('render', render_seconds + time.perf_counter() - render_start)
+        cache_response(chat_id, content, chunk_ids, bot_response, query_embedding)
+        formatted_response = save_exchange(chat_id, content, bot_response, citations, ''.join(html))
+        yield done_event(formatted_response)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route("/metrics")
+def metrics():
+    # Left open for Prometheus to scrape; it holds only counts and timings
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(registry.expose(), mimetype='text/plain; version=0.0.4')
+
+@app.route("/llm_stats")
+@login_required
+def llm_stats():
+    return jsonify(llm_client.stats())
+
+@app.route("/cache_stats")
+@login_required
+def cache_stats():
+    stats = query_cache.stats()
+    if response_cache is not None:
+        stats['responses'] = response_cache.stats()
+    return jsonify(stats)
 
 @app.route("/delete_chat/<int:chat_id>", methods=['POST'])
 @login_required
 def delete_chat(chat_id):
     chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
     db.session.delete(chat)
     db.session.commit()
+    # The id can be handed to a new chat, which must not inherit these documents
+    discard_documents(chat_id)
     return redirect(url_for('home'))
 
 @app.route("/upload_documents/<int:chat_id>", methods=['POST'])
 @login_required
 def upload_documents(chat_id):
+    chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
     if 'documents' not in request.files:
         flash('No file part', 'danger')
         return redirect(url_for('chat', chat_id=chat_id))
     
     files = request.files.getlist('documents')
-    
-    global documents, index, doc_embeddings, doc_metadata
-    documents.clear()
-    doc_embeddings = []
-    doc_metadata = []
 
     uploads_dir = os.path.join(app.config['UPLOAD_FOLDER'], str(chat_id))
     os.makedirs(uploads_dir, exist_ok=True)
     
+    saved = []
     for file in files:
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             file_path = os.path.join(uploads_dir, filename)
             file.save(file_path)
-            
-            text_chunks, embeddings = process_document(file_path)
-            summary = summarize_document(text_chunks[0], filename)  # Use the first chunk to create a summary
-            documents.append(summary)
-
-            # Store embeddings and metadata for each chunk
-            for i, embedding in enumerate(embeddings):
-                doc_embeddings.append(embedding)
-                doc_metadata.append({'filename': filename, 'chunk_index': i, 'chunk_text': text_chunks[i]})
-    
-    # Update the FAISS index with new embeddings
-    if doc_embeddings:
-        doc_embeddings_np = np.array(doc_embeddings)
-        if index is None:
-            index = faiss.IndexFlatL2(doc_embeddings_np.shape[1])  # L2 distance
-        index.add(doc_embeddings_np)
-    
-    flash('Documents uploaded and processed successfully', 'success')
+            saved.append((filename, file_path))
+
+    # Parsing, embedding, summarizing and indexing continue in the background
+    job_id = ingest_pipeline.submit(chat_id, saved)
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id}), 202
+    flash('Documents uploaded and are being processed', 'success')
     return redirect(url_for('chat', chat_id=chat_id))
 
+@app.route("/ingest_status/<job_id>")
+@login_required
+def ingest_status(job_id):
+    job = ingest_pipeline.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    chat = Chat.query.get_or_404(job['chat_id'])
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(job)
+
 @app.route("/get_documents/<int:chat_id>")
 @login_required
 def get_documents(chat_id):
@@ -338,20 +652,55 @@ def get_documents(chat_id):
     document_list = [f for f in os.listdir(uploads_dir) if os.path.isfile(os.path.join(uploads_dir, f))]
     return jsonify(document_list)
 
+@app.route("/document_summary/<int:chat_id>/<path:filename>")
+@login_required
+def document_summary(chat_id, filename):
+    chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    chat_index = get_chat_index(chat_index_dir(chat_id))
+    indexed = chat_index.find_file(filename) if chat_index is not None else None
+    if indexed is None:
+        return jsonify({'error': 'Document not found'}), 404
+    sha256 = indexed['sha256']
+    summary = summarizer.get(sha256)
+    if summary is None and not summarizer.pending(sha256):
+        # Nothing stored and nothing running: the summary failed or was
+        # never made, so summarize again from the indexed chunks
+        positions = chat_index.file_positions(indexed['file_id'])
+        sample = positions[sample_positions(len(positions), app.config['SUMMARY_SAMPLE_CHUNKS'])]
+        summarizer.submit(sha256, filename, [chat_index.chunk(int(p))['chunk_text'] for p in sample])
+        summary = summarizer.get(sha256)
+    if summary is not None:
+        state = 'ready'
+    else:
+        state = 'pending' if summarizer.pending(sha256) else 'unavailable'
+    return jsonify({'filename': filename, 'summary': summary, 'state': state})
+
+@app.route("/delete_document/<int:chat_id>/<path:filename>", methods=['POST'])
+@login_required
+def delete_document(chat_id, filename):
+    chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    filename = secure_filename(filename)
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], str(chat_id), filename)
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    update_documents(chat_index_dir(chat_id), remove=[filename])
+    return jsonify({'deleted': filename})
+
 @app.route("/clear_chat/<int:chat_id>", methods=['POST'])
 @login_required
 def clear_chat(chat_id):
     chat = Chat.query.get_or_404(chat_id)
+    if chat.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
     
     Message.query.filter_by(chat_id=chat_id).delete()
-    
-    uploads_dir = os.path.join(app.config['UPLOAD_FOLDER'], str(chat_id))
-    if os.path.exists(uploads_dir):
-        shutil.rmtree(uploads_dir)
-    
-    global documents
-    documents.clear()
-    
+    discard_documents(chat_id)
     db.session.commit()
     flash('Chat cleared and all associated documents deleted', 'info')
     return redirect(url_for('chat', chat_id=chat_id))
@@ -0,0 +1,71 @@
+"""Chunks per document and retrieval hit rate: token-aware vs 1000-char chunker.
+
+    python benchmarks/bench_chunking.py --docs 20 --k 10
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from sentence_transformers import SentenceTransformer
+
+from chunking import TokenChunker, chunk_text
+from embeddings import encode_chunks
+from corpus import make_corpus
+
+
+def evaluate(model, documents, questions, chunker, k):
+    chunks, owners = [], []
+    for d, segments in enumerate(documents):
+        for chunk in chunker(segments):
+            chunks.append(chunk)
+            owners.append(d)
+
+    start = time.perf_counter()
+    embeddings = encode_chunks(model, chunks)
+    embed_secs = time.perf_counter() - start
+
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    _, I = index.search(encode_chunks(model, [q for q, _, _ in questions]), k)
+    hits = sum(any(answer in chunks[i] for i in row if i >= 0) for (_, answer, _), row in zip(questions, I))
+
+    limit = model.max_seq_length - 2
+    truncated = sum(len(model.tokenizer(c, add_special_tokens=False)['input_ids']) > limit for c in chunks)
+    return {
+        'chunks/doc': len(chunks) / len(documents),
+        'truncated': truncated / len(chunks),
+        'embed secs': embed_secs,
+        f'hit@{k}': hits / len(questions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=20)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--overlap-tokens', type=int, default=32)
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    documents, questions = make_corpus(n_docs=args.docs)
+    token_chunker = TokenChunker(copy.deepcopy(model.tokenizer), max_tokens=model.max_seq_length - 2,
+                                 overlap_tokens=args.overlap_tokens)
+    chunkers = {
+        'chars (1000/200)': lambda segments: chunk_text(''.join(segments)),
+        f'tokens ({model.max_seq_length - 2}/{args.overlap_tokens})': token_chunker.iter_chunks,
+    }
+
+    print(f"{len(documents)} documents, {len(questions)} questions")
+    for name, chunker in chunkers.items():
+        result = evaluate(model, documents, questions, chunker, args.k)
+        print(f"{name:<22} " + '  '.join(f"{key} {value:7.3f}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
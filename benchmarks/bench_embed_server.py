@@ -0,0 +1,112 @@
+"""Concurrent query encoding: one model per worker vs the shared micro-batching server.
+
+Each of --threads threads encodes --queries single questions, as
+send_message does. The in-process run shares one model between the
+threads; the server run sends every query through EmbeddingClient. Also
+reports what a worker pays at boot and in RSS for each:
+
+    python benchmarks/bench_embed_server.py --threads 16 --queries 50 --window-ms 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from corpus import make_corpus
+from embed_server import EmbeddingClient, EmbeddingServer
+
+MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+BOOT = """
+import resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+if {url!r}:
+    from embed_server import EmbeddingClient
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoTokenizer
+    EmbeddingClient({url!r}, lambda: SentenceTransformer({model!r}),
+                    lambda: AutoTokenizer.from_pretrained({model!r}))
+else:
+    from sentence_transformers import SentenceTransformer
+    SentenceTransformer({model!r})
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+
+def boot(url=''):
+    # (seconds, peak RSS in MB) of a fresh worker process getting its encoder
+    code = BOOT.format(root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), url=url, model=MODEL)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    secs, rss = output.split()[-2:]
+    return float(secs), float(rss)
+
+
+def run(model, questions, threads, per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        mine = []
+        for i in range(per_thread):
+            question = questions[(offset * per_thread + i) % len(questions)]
+            start = time.perf_counter()
+            model.encode([question])
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return len(latencies) / wall, np.percentile(ms, 50), np.percentile(ms, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=50, help='per thread')
+    parser.add_argument('--window-ms', type=float, default=5.0)
+    parser.add_argument('--max-batch', type=int, default=256)
+    args = parser.parse_args()
+
+    _, questions = make_corpus(n_docs=50)
+    questions = [q for q, _, _ in questions]
+
+    from sentence_transformers import SentenceTransformer
+    from transformers import AutoTokenizer
+
+    model = SentenceTransformer(MODEL)
+    url = 'unix://' + os.path.join(tempfile.mkdtemp(), 'embed.sock')
+    server = EmbeddingServer(url, model, window=args.window_ms / 1000, max_batch=args.max_batch).start()
+    client = EmbeddingClient(url, lambda: SentenceTransformer(MODEL), lambda: AutoTokenizer.from_pretrained(MODEL))
+
+    print("worker boot (fresh process, imports included):")
+    for name, worker_url in (('in-process', ''), ('server', url)):
+        secs, rss = boot(worker_url)
+        print(f"  {name:<12} {secs:6.2f}s  peak RSS {rss:6.0f} MB")
+
+    print(f"{args.threads} threads x {args.queries} single-question encodes")
+    print(f"{'':<12} {'queries/s':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, encoder in (('in-process', model), ('server', client)):
+        rate, p50, p95 = run(encoder, questions, args.threads, args.queries)
+        print(f"{name:<12} {rate:10.1f} {p50:8.2f} {p95:8.2f}")
+    print(f"server made {server.batcher.batches} model calls for {server.batcher.texts} texts")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Chunks/sec of the batched embedding stage against the old per-chunk path.
+
+    python benchmarks/bench_embedding.py --chunks 2000 --batch-size 64
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import SentenceTransformer
+
+from embeddings import encode_chunks
+
+WORDS = ("policy employee leave request manager approval system report quarterly "
+         "revenue invoice customer support ticket network server backup schedule").split()
+
+
+def synthetic_chunks(n, chunk_size=1000, seed=0):
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(n):
+        words = []
+        length = 0
+        while length < chunk_size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        chunks.append(" ".join(words)[:chunk_size])
+    return chunks
+
+
+def per_chunk(model, chunks):
+    return [model.encode([chunk])[0] for chunk in chunks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2')
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    chunks = synthetic_chunks(args.chunks)
+    encode_chunks(model, chunks[:args.batch_size], batch_size=args.batch_size)  # warm-up
+
+    start = time.perf_counter()
+    per_chunk(model, chunks)
+    per_chunk_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = encode_chunks(model, chunks, batch_size=args.batch_size)
+    batched_secs = time.perf_counter() - start
+
+    assert matrix.flags['C_CONTIGUOUS'] and matrix.dtype.name == 'float32'
+    print(f"chunks:     {len(chunks)}")
+    print(f"per-chunk:  {len(chunks) / per_chunk_secs:8.1f} chunks/sec")
+    print(f"batched:    {len(chunks) / batched_secs:8.1f} chunks/sec (batch_size={args.batch_size})")
+    print(f"speed-up:   {per_chunk_secs / batched_secs:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
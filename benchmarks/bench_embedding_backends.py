@@ -0,0 +1,107 @@
+"""Chunks/sec, load time and RSS of the embedding backends, plus a parity check.
+
+Each backend runs in a fresh process (so RSS is its own) over the same
+chunks; the ONNX model is exported beforehand, in a separate process, so
+its one-off torch import doesn't count. Exits non-zero if the ONNX vectors'
+cosine similarity to the PyTorch ones drops below --min-cosine
+(--min-cosine-int8 for the quantized model):
+
+    python benchmarks/bench_embedding_backends.py --chunks 2000 --batch-size 64
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from corpus import make_corpus
+
+VARIANTS = {'torch': ('torch', False), 'onnx': ('onnx', False), 'onnx-int8': ('onnx', True)}
+
+# Runs in the child; prints load seconds, encode seconds and peak RSS in MB
+RUN = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+import numpy as np
+from embeddings import load_embedder
+start = time.perf_counter()
+model = load_embedder({model!r}, {backend!r}, quantize={quantize!r}, cache_dir={onnx_dir!r}, threads={threads!r})
+loaded = time.perf_counter() - start
+if {out!r}:
+    with open({chunks!r}) as f:
+        chunks = json.load(f)
+    model.encode(chunks[:{batch_size!r}], batch_size={batch_size!r})  # warm-up
+    start = time.perf_counter()
+    vectors = model.encode(chunks, batch_size={batch_size!r}, convert_to_numpy=True)
+    encoded = time.perf_counter() - start
+    np.save({out!r}, np.asarray(vectors, dtype=np.float32))
+    print(loaded, encoded, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+
+def run(variant, args, workdir, chunks_path, out=''):
+    backend, quantize = VARIANTS[variant]
+    code = RUN.format(root=ROOT, model=args.model, backend=backend, quantize=quantize, onnx_dir=args.onnx_dir,
+                      threads=args.threads, out=out, chunks=chunks_path, batch_size=args.batch_size)
+    result = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(f"{variant} failed:\n{result.stderr}")
+    return [float(value) for value in result.stdout.split()[-3:]] if out else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--onnx-dir', default=os.path.join(ROOT, 'cache', 'onnx'))
+    parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime threads (0: all cores)')
+    parser.add_argument('--min-cosine', type=float, default=0.999)
+    parser.add_argument('--min-cosine-int8', type=float, default=0.98)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    documents, _ = make_corpus(n_docs=max(1, args.chunks // 40 + 1))
+    chunks = [paragraph for document in documents for paragraph in document][:args.chunks]
+    chunks_path = os.path.join(workdir, 'chunks.json')
+    with open(chunks_path, 'w') as f:
+        json.dump(chunks, f)
+
+    for variant in args.variants:
+        if VARIANTS[variant][0] == 'onnx':
+            run(variant, args, workdir, chunks_path)  # export/quantize once, untimed
+
+    results = {}
+    print(f"chunks: {len(chunks)}, batch size {args.batch_size}")
+    print(f"{'backend':<10} {'load s':>7} {'chunks/s':>9} {'peak RSS MB':>12} {'cos min':>8} {'cos mean':>9}")
+    for variant in args.variants:
+        out = os.path.join(workdir, f"{variant}.npy")
+        loaded, encoded, rss = run(variant, args, workdir, chunks_path, out)
+        results[variant] = np.load(out)
+        parity = ''
+        if variant != 'torch' and 'torch' in results:
+            a, b = results['torch'], results[variant]
+            cos = (a * b).sum(1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+            results[variant + ':cos'] = cos.min()
+            parity = f"{cos.min():8.5f} {cos.mean():9.5f}"
+        print(f"{variant:<10} {loaded:7.2f} {len(chunks) / encoded:9.1f} {rss:12.0f} {parity}")
+
+    failed = False
+    for variant in args.variants:
+        cos = results.get(variant + ':cos')
+        limit = args.min_cosine_int8 if VARIANTS[variant][1] else args.min_cosine
+        if cos is not None and cos < limit:
+            print(f"FAIL: {variant} min cosine {cos:.5f} < {limit}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Chat page-load time as chats grow, and concurrent writers on SQLite.
+
+Fills a scratch database with chats of --sizes messages, then times the
+chat page (latest page only), fetching an older page from the middle of
+the history, and the old full-history page for comparison. Paged loads
+should stay flat as the chat grows; the full load grows with it. Then
+--writers threads save messages concurrently, as gunicorn workers do,
+while --readers threads load the chat page; lock errors and read latency
+are reported (--no-pragmas for the default rollback journal to compare):
+
+    python benchmarks/bench_history.py --sizes 100 1000 10000 50000 --writers 8 --readers 4
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def fill(db, Chat, Message, user_id, size):
+    chat = Chat(title=f"{size} messages", user_id=user_id)
+    db.session.add(chat)
+    db.session.commit()
+    start = datetime(2024, 1, 1)
+    rows = [{'chat_id': chat.id, 'is_user': i % 2 == 0, 'timestamp': start + timedelta(seconds=i),
+             'content': f"<p>Message {i}: the quarterly report is ready for review.</p>", 'citations': '[]'}
+            for i in range(size)]
+    for i in range(0, size, 5000):
+        db.session.execute(db.insert(Message), rows[i:i + 5000])
+    db.session.commit()
+    return chat.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='messages saved per writer')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--no-pragmas', action='store_true', help='default journal mode, no busy timeout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    import config
+    config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'history.db')
+    if args.no_pragmas:
+        config.Config.SQLITE_PRAGMAS = {}
+    import app as application
+    from models import db, User, Chat, Message
+    app = application.app
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        chats = {size: fill(db, Chat, Message, user.id, size) for size in args.sizes}
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    def full_history(chat_id):
+        # The chat view before pagination: every message, rendered
+        with app.test_request_context():
+            chat = db.session.get(Chat, chat_id)
+            messages = Message.query.filter_by(chat_id=chat_id).order_by(Message.timestamp).all()
+            application.render_template('chat.html', chat=chat, messages=messages, next_before=None)
+
+    print(f"{'messages':>9} {'chat page ms':>13} {'older page ms':>14} {'full history ms':>16}")
+    for size, chat_id in chats.items():
+        page = client.get(f"/chat/{chat_id}/messages?limit={max(1, size // 2)}").get_json()
+        middle = page['messages'][0]['id']
+        assert client.get(f"/chat/{chat_id}").status_code == 200
+        paged = median_ms(lambda: client.get(f"/chat/{chat_id}"), args.repeat)
+        older = median_ms(lambda: client.get(f"/chat/{chat_id}/messages?before={middle}"), args.repeat)
+        full = median_ms(lambda: full_history(chat_id), max(1, args.repeat // 4))
+        print(f"{size:9d} {paged:13.2f} {older:14.2f} {full:16.2f}")
+
+    # Paging back through a whole chat returns every message once, in order
+    size, chat_id = min(chats.items())
+    seen, before = [], ''
+    while True:
+        page = client.get(f"/chat/{chat_id}/messages?limit=7&before={before}").get_json()
+        seen = [m['id'] for m in page['messages']] + seen
+        if page['before'] is None:
+            break
+        before = page['before']
+    assert len(seen) == size and seen == sorted(seen), "pagination skipped or repeated messages"
+
+    errors = []
+
+    def writer(chat_id):
+        with app.app_context():
+            for i in range(args.writes):
+                try:
+                    application.save_exchange(chat_id, f"question {i}", f"answer {i}", [])
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(e)
+
+    done = threading.Event()
+    reads = []
+
+    def reader(chat_id):
+        reader_client = app.test_client()
+        with reader_client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        while not done.is_set():
+            start = time.perf_counter()
+            if reader_client.get(f"/chat/{chat_id}").status_code != 200:
+                errors.append(RuntimeError("chat page failed"))
+            reads.append(time.perf_counter() - start)
+
+    chat_id = chats[min(chats)]
+    readers = [threading.Thread(target=reader, args=(chat_id,)) for _ in range(args.readers)]
+    writers = [threading.Thread(target=writer, args=(chat_id,)) for _ in range(args.writers)]
+    for thread in readers:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in readers:
+        thread.join()
+    locked = sum('locked' in str(e) for e in errors)
+    print(f"{args.writers} writers x {args.writes} exchanges: {elapsed:.2f}s, "
+          f"{args.writers * args.writes / elapsed:.0f} exchanges/s, {len(errors)} errors ({locked} 'database is locked')")
+    if reads:
+        reads.sort()
+        print(f"{args.readers} readers meanwhile: {len(reads)} page loads, "
+              f"p50 {reads[len(reads) // 2] * 1000:.1f}ms, p95 {reads[int(len(reads) * 0.95)] * 1000:.1f}ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""BM25 build time, query latency and hit rate, optionally against dense and fused retrieval.
+
+The lexical side needs no model. With --dense the questions are also run
+through MiniLM + FAISS and through reciprocal rank fusion of both:
+
+    python benchmarks/bench_hybrid.py --docs 2000 --k 10
+    python benchmarks/bench_hybrid.py --docs 200 --dense
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from chunking import iter_chunks
+from corpus import make_corpus
+from lexical import LexicalIndex, postings, rrf
+from vector_store import HYBRID_CANDIDATES
+
+
+def hit_rate(chunks, questions, rankings, k):
+    return np.mean([any(answer in chunks[i] for i in ranking[:k]) for (_, answer, _), ranking in zip(questions, rankings)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dense', action='store_true', help='also compare with MiniLM + FAISS')
+    args = parser.parse_args()
+
+    documents, questions = make_corpus(n_docs=args.docs)
+    chunks = [chunk for segments in documents for chunk in iter_chunks(segments)]
+
+    start = time.perf_counter()
+    lexical = LexicalIndex.from_postings(*postings(chunks))
+    build_secs = time.perf_counter() - start
+    print(f"{len(chunks)} chunks, {len(lexical.docs)} postings, {len(lexical.terms)} terms, built in {build_secs:.1f}s")
+
+    latencies, lexical_rankings = [], []
+    for question, _, _ in questions:
+        start = time.perf_counter()
+        positions, _ = lexical.search(question, HYBRID_CANDIDATES)
+        latencies.append((time.perf_counter() - start) * 1000)
+        lexical_rankings.append(positions.tolist())
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{len(questions)} queries: p50 {p50:.2f} ms  p95 {p95:.2f} ms per BM25 search")
+    print(f"hit@{args.k}  bm25   {hit_rate(chunks, questions, lexical_rankings, args.k):.3f}")
+
+    if args.dense:
+        import faiss
+        from sentence_transformers import SentenceTransformer
+        from embeddings import encode_chunks
+
+        model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        embeddings = encode_chunks(model, chunks)
+        faiss.normalize_L2(embeddings)
+        index = faiss.IndexFlatIP(embeddings.shape[1])
+        index.add(embeddings)
+        queries = encode_chunks(model, [q for q, _, _ in questions])
+        faiss.normalize_L2(queries)
+        _, I = index.search(queries, HYBRID_CANDIDATES)
+        dense_rankings = [[int(i) for i in row if i >= 0] for row in I]
+        fused_rankings = []
+        for dense, lexical_ranking in zip(dense_rankings, lexical_rankings):
+            fused = rrf([dense, lexical_ranking])
+            fused_rankings.append(sorted(fused, key=fused.get, reverse=True))
+        print(f"hit@{args.k}  dense  {hit_rate(chunks, questions, dense_rankings, args.k):.3f}")
+        print(f"hit@{args.k}  fused  {hit_rate(chunks, questions, fused_rankings, args.k):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Recall@10 and query latency of each index tier against the flat baseline.
+
+Uses clustered random vectors shaped like MiniLM embeddings, so it needs no
+model download:
+
+    python benchmarks/bench_index_tiers.py --vectors 200000 --nprobe 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from vector_store import FLAT, IVF_FLAT, IVF_PQ, IndexPolicy
+
+
+def clustered_vectors(n, dim, clusters=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(points)
+    return points
+
+
+def run(index, queries, k):
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q[None, :], k)  # one query at a time, like send_message
+    latency_ms = (time.perf_counter() - start) / len(queries) * 1000
+    _, I = index.search(queries, k)
+    return I, latency_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--pq-m', type=int, default=48)
+    args = parser.parse_args()
+
+    data = clustered_vectors(args.vectors + args.queries, args.dim)
+    corpus, queries = data[:args.vectors], data[args.vectors:]
+    ids = np.arange(args.vectors, dtype=np.int64)
+    policy = IndexPolicy(pq_m=args.pq_m)
+
+    flat = policy.build(FLAT, args.dim)
+    flat.add_with_ids(corpus, ids)
+    truth, flat_ms = run(flat, queries, args.k)
+    print(f"{args.vectors} vectors, {args.queries} queries, dim {args.dim}")
+    print(f"{'tier':<10} {'nprobe':>6} {'build s':>8} {'ms/query':>9} {f'recall@{args.k}':>10}")
+    print(f"{FLAT:<10} {'-':>6} {'-':>8} {flat_ms:9.3f} {1.0:10.3f}")
+
+    sample = corpus[np.random.default_rng(1).choice(args.vectors, min(args.vectors, policy.nlist_for(args.vectors) * 64), replace=False)]
+    for tier in (IVF_FLAT, IVF_PQ):
+        start = time.perf_counter()
+        index = policy.build(tier, args.dim, sample)
+        index.add_with_ids(corpus, ids)
+        build_secs = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            faiss.extract_index_ivf(index).nprobe = nprobe
+            found, ms = run(index, queries, args.k)
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            print(f"{tier:<10} {nprobe:>6} {build_secs:8.1f} {ms:9.3f} {recall:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Bare requests.post against the pooled, concurrency-limited LLM client.
+
+Fires --requests generations from --threads threads at a stub Ollama that
+serves one generation at a time, and reports latency, errors and the
+client's queue-wait and generation metrics:
+
+    python benchmarks/bench_llm_client.py --threads 16 --requests 64 --timeout 2
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import requests
+
+import stub_ollama
+from llm_client import LLMClient
+
+
+def bare(endpoint, timeout):
+    def call(prompt):
+        response = requests.post(endpoint, json={"model": "llama3.1", "prompt": prompt, "stream": False},
+                                  timeout=timeout)
+        response.raise_for_status()
+        return response.json()['response']
+    return call
+
+
+def run(call, threads, n):
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            call(f"question {i}")
+            return time.perf_counter() - start, None
+        except requests.RequestException as e:
+            return time.perf_counter() - start, type(e).__name__
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(timed, range(n)))
+    wall = time.perf_counter() - start
+    latencies = np.array([secs for secs, error in results if error is None]) * 1000
+    errors = [error for _, error in results if error is not None]
+    return wall, latencies, errors
+
+
+def report(name, wall, latencies, errors):
+    p50, p95 = (np.percentile(latencies, [50, 95]) if len(latencies) else (float('nan'),) * 2)
+    kinds = ', '.join(sorted(set(errors))) or '-'
+    print(f"{name:<8} {wall:7.2f}s {len(latencies):>4} ok {len(errors):>4} failed ({kinds})  p50 {p50:7.0f} ms  p95 {p95:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--tokens', type=int, default=20)
+    parser.add_argument('--token-ms', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=2.0, help='read timeout in seconds')
+    parser.add_argument('--concurrency', type=int, default=1, help='client generation slots')
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests from {args.threads} threads, "
+          f"{args.tokens * args.token_ms:.0f} ms per generation, one at a time")
+
+    # A fresh stub per run so generations abandoned by timed-out callers
+    # don't hold up the next run.
+    server, endpoint = stub_ollama.start(tokens=args.tokens, token_ms=args.token_ms, fail_rate=args.fail_rate)
+    report('bare', *run(bare(endpoint, args.timeout), args.threads, args.requests))
+    server.shutdown()
+
+    server, endpoint = stub_ollama.start(tokens=args.tokens, token_ms=args.token_ms, fail_rate=args.fail_rate)
+    client = LLMClient(endpoint, 'llama3.1', timeout=args.timeout, max_concurrency=args.concurrency,
+                       queue_timeout=None)
+    report('client', *run(client.generate, args.threads, args.requests))
+    stats = client.stats()
+    for name in ('queue_wait', 'generation'):
+        print(f"  {name:<11} mean {stats[name]['mean_ms']:7.0f} ms  max {stats[name]['max_ms']:7.0f} ms")
+    print(f"  retries {stats['retries']}  errors {stats['errors']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
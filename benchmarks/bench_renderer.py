@@ -0,0 +1,106 @@
+"""Render time of the single-pass renderer against the old regex chain.
+
+Each case is generated at increasing sizes. A renderer without
+catastrophic backtracking takes about 2x as long when the input doubles;
+the old chain takes 4x on the adversarial cases, so it is skipped above
+--legacy-max characters, where it takes seconds to minutes:
+
+    python benchmarks/bench_renderer.py --sizes 5000 10000 20000 40000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from renderer import Renderer, render
+
+ANSWER = """Here is a summary of the **quarterly report**:
+
+1. Revenue grew by *12%* compared to last year.
+2. Support tickets dropped after the **network upgrade**.
+   Most of the drop came from fewer outages.
+
+| Team | Tickets | Change |
+|---|---|---|
+| Network | 120 | -30% |
+| Support | 340 | *-12%* |
+
+• Backups now run nightly
+• The audit is scheduled for **March**
+
+Let me know if you need the full breakdown.
+"""
+
+# name -> function of size giving an answer of about that many characters.
+# Digit runs (IDs, hashes) and unclosed <li> tags make the old chain's
+# lazy DOTALL patterns rescan the rest of the answer from every position.
+CASES = {
+    'typical answer': lambda n: ANSWER * (n // len(ANSWER) + 1),
+    'long digit run': lambda n: 'Checksum: ' + '7' * n,
+    'unclosed <li> tags': lambda n: '<li>item ' * (n // 9),
+    'long table': lambda n: 'a | b | c\n' * (n // 10),
+    'unpaired emphasis': lambda n: '**note* a\n' * (n // 10),
+}
+
+
+def legacy_process_response(response):
+    # process_response as it was before renderer.py, for comparison
+    response = re.sub(r'(\d+\.\s*.*?)(?=\n\d+\.|\Z)', r'<li>\1</li>', response, flags=re.DOTALL)
+    response = re.sub(r'((?:<li>.*?</li>\n*)+)', r'<ol>\1</ol>', response, flags=re.DOTALL)
+    response = re.sub(r'(•\s*.*?)(?=\n•|\Z)', r'<li>\1</li>', response, flags=re.DOTALL)
+    response = re.sub(r'((?:<li>.*?</li>\n*)+)', r'<ul>\1</ul>', response, flags=re.DOTALL)
+
+    def table_replace(match):
+        rows = match.group(1).split('\n')
+        table_html = '<table class="border-collapse border border-gray-400 w-full">'
+        for i, row in enumerate(rows):
+            cells = row.split('|')
+            table_html += '<tr>'
+            for cell in cells:
+                tag = 'th' if i == 0 else 'td'
+                table_html += f'<{tag} class="border border-gray-400 px-4 py-2">{cell.strip()}</{tag}>'
+            table_html += '</tr>'
+        table_html += '</table>'
+        return table_html
+
+    response = re.sub(r'\n((?:[^|\n]+\|)+[^|\n]+(?:\n(?:[^|\n]+\|)+[^|\n]+)*)', table_replace, response)
+    response = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', response)
+    response = re.sub(r'\*(.*?)\*', r'<em>\1</em>', response)
+    response = re.sub(r'(?<!>)\n(?!<)', '<br>', response)
+    return response
+
+
+def streamed(text, piece=4):
+    # As the streaming route renders: a few characters per token
+    renderer = Renderer()
+    html = [renderer.feed(text[i:i + piece]) for i in range(0, len(text), piece)]
+    return ''.join(html) + renderer.close()
+
+
+def timed(fn, text):
+    start = time.perf_counter()
+    fn(text)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 10000, 20000, 40000])
+    parser.add_argument('--legacy-max', type=int, default=20000, help='largest input given to the old chain')
+    args = parser.parse_args()
+
+    print(f"{'case':<26} {'chars':>7} {'render ms':>10} {'streamed ms':>12} {'old chain ms':>13}")
+    for name, make in CASES.items():
+        for size in args.sizes:
+            text = make(size)
+            assert streamed(text) == render(text)
+            old = f"{timed(legacy_process_response, text) * 1000:13.1f}" if size <= args.legacy_max else f"{'skipped':>13}"
+            print(f"{name:<26} {len(text):7d} {timed(render, text) * 1000:10.2f} "
+                  f"{timed(streamed, text) * 1000:12.2f} {old}")
+
+
+if __name__ == '__main__':
+    main()
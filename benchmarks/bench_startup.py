@@ -0,0 +1,85 @@
+"""App import time, slowest imports and time to first request, in fresh processes.
+
+Fails (exit status 1) if importing the app pulls in any of the heavy
+modules that should load lazily, or if --max-seconds is exceeded, so it
+can guard startup against regressions:
+
+    python benchmarks/bench_startup.py --top 15 --max-seconds 2
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('torch', 'sentence_transformers', 'transformers', 'faiss', 'pandas', 'PyPDF2', 'docx', 'pptx', 'openpyxl')
+
+# Runs in the child: import the app against a scratch database, serve one
+# request, and report seconds since the parent spawned it.
+FIRST_REQUEST = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(os.getcwd(), 'startup.db')
+import app
+imported = time.time() - {spawned!r}
+status = app.app.test_client().get('/login').status_code
+print(imported, time.time() - {spawned!r}, status)
+print(' '.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def import_times(workdir):
+    # {module: (self us, cumulative us)} from python -X importtime
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import app"
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=workdir,
+                            capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def first_request(workdir):
+    code = FIRST_REQUEST.format(root=ROOT, spawned=time.time(), heavy=HEAVY)
+    lines = subprocess.run([sys.executable, '-c', code], cwd=workdir,
+                           capture_output=True, text=True, check=True).stdout.splitlines()
+    imported, served, status = lines[-2].split()
+    return float(imported), float(served), int(status), lines[-1].split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--runs', type=int, default=3, help='first-request runs (best is reported)')
+    parser.add_argument('--max-seconds', type=float, default=None, help='fail above this time to first request')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    times = import_times(workdir)
+    print(f"import app: {times['app'][1] / 1e6:.3f}s cumulative")
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}")
+
+    runs = [first_request(workdir) for _ in range(args.runs)]
+    imported, served, status, heavy = min(runs, key=lambda run: run[1])
+    print(f"process start -> app imported {imported:.3f}s, -> first response ({status}) {served:.3f}s")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy)}")
+        failed = True
+    if args.max_seconds is not None and served > args.max_seconds:
+        print(f"FAIL: first response after {served:.3f}s (limit {args.max_seconds}s)")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Memory per million chunks, QPS and recall@10 of the vector storage options.
+
+Compares the original IndexFlatL2 over raw vectors with cosine
+(inner-product over normalised vectors) search stored as float32, fp16 and
+int8, using clustered random vectors shaped like MiniLM embeddings:
+
+    python benchmarks/bench_vector_storage.py --vectors 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from vector_store import FLAT, FLOAT32, FP16, INT8, IndexPolicy, normalized
+
+
+def clustered_vectors(n, dim, clusters=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    scale = rng.uniform(0.5, 2.0, (n, 1)).astype(np.float32)  # un-normalised, like raw model output
+    return scale * (centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def measure(index, queries, k):
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q[None, :], k)
+    qps = len(queries) / (time.perf_counter() - start)
+    _, I = index.search(queries, k)
+    return I, qps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    data = clustered_vectors(args.vectors + args.queries, args.dim)
+    corpus, queries = data[:args.vectors], data[args.vectors:]
+    ids = np.arange(args.vectors, dtype=np.int64)
+
+    # Ground truth: exact cosine similarity
+    exact = faiss.IndexFlatIP(args.dim)
+    exact.add(normalized(corpus))
+    _, truth = exact.search(normalized(queries), args.k)
+
+    print(f"{args.vectors} vectors, {args.queries} queries, dim {args.dim}")
+    print(f"{'index':<18} {'MB/1M chunks':>12} {'QPS':>9} {f'recall@{args.k}':>10}")
+
+    baseline = faiss.IndexFlatL2(args.dim)
+    baseline.add(corpus)
+    rows = [('IndexFlatL2 (old)', baseline, queries)]
+    for storage in (FLOAT32, FP16, INT8):
+        index = IndexPolicy(storage=storage).build(FLAT, args.dim, normalized(corpus[:65536]))
+        index.add_with_ids(normalized(corpus), ids)
+        rows.append((f'cosine {storage}', index, normalized(queries)))
+
+    for name, index, q in rows:
+        size = len(faiss.serialize_index(index))
+        found, qps = measure(index, q, args.k)
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        print(f"{name:<18} {size / args.vectors * 1e6 / 2**20:12.0f} {qps:9.0f} {recall:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Synthetic document corpus with known answers, shared by the benchmarks.
+
+Each document is a list of paragraph segments (the shape the parsers
+produce). A few paragraphs state a unique fact such as an access code, and
+every fact comes with a question whose answer is that code, so retrieval can
+be scored by whether a returned chunk contains the code.
+"""
+import random
+
+FILLER = ("the team reviewed the quarterly report and agreed that the process "
+          "should be documented before the next audit while the manager noted "
+          "that the schedule depends on approval from finance and support staff "
+          "who maintain the network servers backups and customer ticket queues").split()
+SUBJECTS = ["vault", "server room", "warehouse", "archive", "lab", "gateway", "depot", "office"]
+ATTRIBUTES = ["access code", "part number", "error code", "ticket number", "asset tag"]
+
+
+def _filler(rng, words):
+    return ' '.join(rng.choice(FILLER) for _ in range(words)).capitalize() + '.'
+
+
+def make_corpus(n_docs=20, paragraphs=40, facts_per_doc=5, seed=0):
+    """Returns (documents, questions).
+
+    documents: list of lists of paragraph strings
+    questions: list of (question, answer, doc_index)
+    """
+    rng = random.Random(seed)
+    documents, questions = [], []
+    for d in range(n_docs):
+        segments = []
+        fact_at = set(rng.sample(range(paragraphs), facts_per_doc))
+        for p in range(paragraphs):
+            text = _filler(rng, rng.randint(40, 160))
+            if p in fact_at:
+                subject = f"{rng.choice(SUBJECTS)} {d}-{p}"
+                attribute = rng.choice(ATTRIBUTES)
+                answer = f"{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}{rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ')}-{rng.randint(1000, 9999)}"
+                sentence = f"The {attribute} for the {subject} is {answer}."
+                words = text.split()
+                cut = rng.randint(0, len(words))
+                text = ' '.join(words[:cut] + [sentence] + words[cut:])
+                questions.append((f"What is the {attribute} for the {subject}?", answer, d))
+            segments.append(text + "\n\n")
+        documents.append(segments)
+    return documents, questions
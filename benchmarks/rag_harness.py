@@ -0,0 +1,204 @@
+"""End-to-end RAG benchmark: upload, ingest and questions, timed per stage.
+
+Runs the app in-process against a stub Ollama (stub_ollama.py) with a
+synthetic corpus (corpus.py) and scratch databases and caches, so runs are
+repeatable and need neither Ollama nor real documents. The corpus is
+uploaded as .txt files and ingested in the background as usual; then the
+questions are asked --passes times at each --concurrency level, each level
+in a fresh chat, so pass 1 runs with cold answer caches and later passes
+show what caching saves. Every stage timed in the app (see metrics.py) is
+collected exactly and reported as p50/p95/p99, next to ingest chunks/sec
+and the cache hit counts read back from /metrics:
+
+    python benchmarks/rag_harness.py --docs 20 --questions 40 --concurrency 1 4 --stream
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import stub_ollama
+from corpus import make_corpus
+
+METRIC_RE = re.compile(r'^(rag_cache_hits_total|rag_cache_misses_total|rag_answers_total)\{\w+="([^"]*)"\} (\S+)$')
+
+
+class Samples:
+    # Stage durations as recorded by the app, plus whole requests
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def take(self):
+        with self._lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+
+def report(title, stages):
+    print(f"\n{title}")
+    print(f"  {'stage':<18} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, times in sorted(stages.items(), key=lambda item: -np.percentile(item[1], 50)):
+        p50, p95, p99 = np.percentile(np.array(times) * 1000, [50, 95, 99])
+        print(f"  {stage:<18} {len(times):6d} {p50:9.2f} {p95:9.2f} {p99:9.2f}")
+
+
+def scrape(client):
+    # {(metric, label value): value} for the cache and answer counters
+    values = {}
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        match = METRIC_RE.match(line)
+        if match:
+            values[match.group(1), match.group(2)] = float(match.group(3))
+    return values
+
+
+def cache_report(before, after):
+    caches = sorted({label for metric, label in after if metric == 'rag_cache_hits_total'})
+    parts = []
+    for cache in caches:
+        hits = after.get(('rag_cache_hits_total', cache), 0) - before.get(('rag_cache_hits_total', cache), 0)
+        misses = after.get(('rag_cache_misses_total', cache), 0) - before.get(('rag_cache_misses_total', cache), 0)
+        parts.append(f"{cache} {hits:.0f}/{hits + misses:.0f}")
+    answers = {label: after[metric, label] - before.get((metric, label), 0)
+               for metric, label in after if metric == 'rag_answers_total'}
+    print("  cache hits: " + ', '.join(parts))
+    print("  answers: " + ', '.join(f"{source} {count:.0f}" for source, count in sorted(answers.items()) if count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=20)
+    parser.add_argument('--paragraphs', type=int, default=40, help='paragraphs per document')
+    parser.add_argument('--questions', type=int, default=40)
+    parser.add_argument('--passes', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--stream', action='store_true', help='ask through /send_message_stream')
+    parser.add_argument('--tokens', type=int, default=50, help='tokens per stub answer')
+    parser.add_argument('--token-ms', type=float, default=20.0)
+    parser.add_argument('--parallel', type=int, default=1, help='generations the stub runs at once')
+    parser.add_argument('--model', help='embedding model (default: EMBEDDING_MODEL from config)')
+    args = parser.parse_args()
+
+    server, endpoint = stub_ollama.start(tokens=args.tokens, token_ms=args.token_ms, parallel=args.parallel)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)  # uploads/ is relative to the working directory
+    os.environ.update({
+        'LLAMA_ENDPOINT': endpoint,
+        'LLAMA_MAX_CONCURRENCY': str(args.parallel),
+        'SUMMARY_DB': os.path.join(workdir, 'summaries.sqlite'),
+        'EMBED_CACHE_DIR': os.path.join(workdir, 'embeddings'),
+        'RESPONSE_CACHE_PATH': os.path.join(workdir, 'responses.sqlite'),
+        'METRICS_ENABLED': 'true',
+    })
+    if args.model:
+        os.environ['EMBEDDING_MODEL'] = args.model
+    import config
+    config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'harness.db')
+    import app as application
+    from metrics import registry
+    from models import db, User, Chat
+    app = application.app
+
+    samples = Samples()
+    registry.subscribe(samples)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    def client():
+        test_client = app.test_client()
+        with test_client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        return test_client
+
+    documents, questions = make_corpus(n_docs=args.docs, paragraphs=args.paragraphs)
+    questions = [question for question, _, _ in questions[:args.questions]]
+    files = [(f"doc{i:03d}.txt", ''.join(segments).encode('utf-8')) for i, segments in enumerate(documents)]
+    main_client = client()
+
+    def new_chat(title):
+        with app.app_context():
+            chat = Chat(title=title, user_id=user_id)
+            db.session.add(chat)
+            db.session.commit()
+            return chat.id
+
+    def ingest(chat_id):
+        start = time.perf_counter()
+        response = main_client.post(f"/upload_documents/{chat_id}", headers={'Accept': 'application/json'},
+                                    data={'documents': [(io.BytesIO(data), name) for name, data in files]},
+                                    content_type='multipart/form-data')
+        job_id = response.get_json()['job_id']
+        while True:
+            job = main_client.get(f"/ingest_status/{job_id}").get_json()
+            if job['state'] == 'done':
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        failed = [entry['filename'] for entry in job['files'] if entry['stage'] == 'failed']
+        assert not failed, f"ingest failed for {failed}"
+        # Summaries run in the background and share the LLM with questions
+        for name, _ in files:
+            while main_client.get(f"/document_summary/{chat_id}/{name}").get_json().get('state') == 'pending':
+                time.sleep(0.05)
+        return elapsed, sum(entry['chunks'] for entry in job['files'])
+
+    chat_id = new_chat('ingest')
+    elapsed, chunks = ingest(chat_id)
+    print(f"ingested {len(files)} documents, {chunks} chunks in {elapsed:.2f}s: {chunks / elapsed:.1f} chunks/sec")
+    report("ingest stages (summaries included)", samples.take())
+
+    route = '/send_message_stream' if args.stream else '/send_message'
+    local = threading.local()
+
+    def ask(chat_id, question):
+        if not hasattr(local, 'client'):
+            local.client = client()
+        start = time.perf_counter()
+        response = local.client.post(route, json={'chat_id': chat_id, 'message': question})
+        response.get_data()  # a streamed answer is only done once it is read
+        samples('request', time.perf_counter() - start)
+        return response.status_code
+
+    for concurrency in args.concurrency:
+        chat_id = new_chat(f"concurrency {concurrency}")
+        ingest(chat_id)
+        samples.take()
+        for n in range(1, args.passes + 1):
+            before = scrape(main_client)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                statuses = list(pool.map(lambda question: ask(chat_id, question), questions))
+            elapsed = time.perf_counter() - start
+            report(f"concurrency {concurrency}, pass {n}: {len(questions) / elapsed:.1f} questions/sec",
+                   samples.take())
+            errors = sum(status != 200 for status in statuses)
+            if errors:
+                print(f"  {errors} requests failed")
+            cache_report(before, scrape(main_client))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
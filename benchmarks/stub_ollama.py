@@ -0,0 +1,96 @@
+"""Stand-in for Ollama's /api/generate that behaves like one local model.
+
+Generations run one at a time (or --parallel at once) and emit --tokens
+tokens at --token-ms intervals, streamed as NDJSON or returned whole.
+--fail-rate answers that fraction of requests with 503 to exercise retries:
+
+    python benchmarks/stub_ollama.py --port 11435 --tokens 50 --token-ms 20
+    LLAMA_ENDPOINT=http://127.0.0.1:11435/api/generate flask run
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(tokens, token_ms, fail_rate, slots):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like Ollama
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if random.random() < fail_rate:
+                self._send(503, b'{"error": "server busy"}', 'application/json')
+                return
+            words = [f"word{i} " for i in range(tokens)]
+            with slots:
+                if body.get('stream'):
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/x-ndjson')
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    for word in words:
+                        time.sleep(token_ms / 1000)
+                        self._chunk(json.dumps({'model': body.get('model'), 'response': word, 'done': False}) + '\n')
+                    self._chunk(json.dumps({'model': body.get('model'), 'response': '', 'done': True}) + '\n')
+                    self.wfile.write(b'0\r\n\r\n')
+                else:
+                    time.sleep(tokens * token_ms / 1000)
+                    payload = json.dumps({'model': body.get('model'), 'response': ''.join(words), 'done': True})
+                    self._send(200, payload.encode('utf-8'), 'application/json')
+
+        def _chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+
+        def _send(self, status, payload, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # clients that gave up on a slow generation close mid-response
+
+
+def start(port=0, tokens=50, token_ms=20.0, parallel=1, fail_rate=0.0):
+    # Serves in a daemon thread; returns (server, generate endpoint URL).
+    handler = make_handler(tokens, token_ms, fail_rate, threading.Semaphore(parallel))
+    server = QuietServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--token-ms', type=float, default=20.0)
+    parser.add_argument('--parallel', type=int, default=1)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, endpoint = start(args.port, args.tokens, args.token_ms, args.parallel, args.fail_rate)
+    print(f"Serving {endpoint}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
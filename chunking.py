@@ -0,0 +1,130 @@
+import threading
+from itertools import islice
+
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        start += chunk_size - overlap
+    return chunks
+
+
+def iter_chunks(segments, chunk_size=1000, overlap=200):
+    # Streaming equivalent of chunk_text(''.join(segments)): emits the same
+    # chunks while only ever buffering about one segment plus one chunk.
+    step = chunk_size - overlap
+    buffer = ''
+    pos = 0
+    for segment in segments:
+        if not segment:
+            continue
+        buffer = buffer[pos:] + segment
+        pos = 0
+        while len(buffer) - pos >= chunk_size:
+            yield buffer[pos:pos + chunk_size]
+            pos += step
+    while pos < len(buffer):
+        yield buffer[pos:pos + chunk_size]
+        pos += step
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class TokenChunker:
+    # Packs text into chunks of at most `max_tokens` word-pieces of the
+    # embedding model's own tokenizer, so nothing is silently truncated at
+    # encode time. Segments from the parsers (pages, paragraphs, slides,
+    # sheet rows) are split into lines and packed whole; a chunk is only cut
+    # mid-line when a single line is longer than a whole chunk, and then on
+    # a token boundary. Each chunk after the first repeats the last
+    # `overlap_tokens` tokens of the one before it.
+    #
+    # The tokenizer is called with its own settings and from several
+    # ingestion threads, so callers should pass a copy that is not also used
+    # by the model, and calls are serialised here.
+    LINES_PER_CALL = 256
+    MAX_LINE_CHARS = 20000
+
+    def __init__(self, tokenizer, max_tokens=254, overlap_tokens=32):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._lock = threading.Lock()
+
+    def _lines(self, segments):
+        for segment in segments:
+            for line in segment.splitlines(keepends=True):
+                # Bound the size of a single tokenizer input
+                while len(line) > self.MAX_LINE_CHARS:
+                    cut = line.rfind(' ', 0, self.MAX_LINE_CHARS) + 1 or self.MAX_LINE_CHARS
+                    yield line[:cut]
+                    line = line[cut:]
+                if line:
+                    yield line
+
+    def _tokenized(self, segments):
+        # (line, token end offsets) pairs, tokenizing lines in batches
+        for lines in batched(self._lines(segments), self.LINES_PER_CALL):
+            with self._lock:
+                encoded = self.tokenizer(lines, add_special_tokens=False, return_offsets_mapping=True,
+                                         verbose=False)
+            for line, offsets in zip(lines, encoded['offset_mapping']):
+                yield line, [end for _, end in offsets]
+
+    def count_tokens(self, texts):
+        with self._lock:
+            encoded = self.tokenizer(list(texts), add_special_tokens=False, verbose=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def iter_chunks(self, segments):
+        text = ''    # current chunk
+        ends = []    # character offset in `text` where each of its tokens ends
+        fresh = 0    # tokens in `text` that are not overlap from the previous chunk
+        for line, line_ends in self._tokenized(segments):
+            pos = 0      # tokens of this line already placed
+            start = 0    # characters of this line already placed
+            while pos < len(line_ends):
+                remaining = len(line_ends) - pos
+                room = self.max_tokens - len(ends)
+                if remaining > room and fresh and remaining <= self.max_tokens - self.overlap_tokens:
+                    # The rest of the line fits whole in the next chunk: cut before it
+                    chunk, text, ends = self._carry(text, ends)
+                    fresh = 0
+                    yield chunk
+                    continue
+                take = min(remaining, room)
+                stop = len(line) if take == remaining else line_ends[pos + take - 1]
+                base = len(text) - start
+                text += line[start:stop]
+                ends.extend(base + end for end in line_ends[pos:pos + take])
+                pos += take
+                start = stop
+                fresh += take
+                if len(ends) >= self.max_tokens:
+                    chunk, text, ends = self._carry(text, ends)
+                    fresh = 0
+                    yield chunk
+            text += line[start:]  # trailing whitespace, or a line without tokens
+        if fresh:
+            yield text
+
+    def _carry(self, text, ends):
+        # Returns the finished chunk plus the text and token ends that start
+        # the next one: the last `overlap_tokens` tokens of this chunk.
+        keep = min(self.overlap_tokens, len(ends) - 1)
+        if keep <= 0:
+            return text, '', []
+        cut = ends[-keep - 1]
+        return text, text[cut:], [end - cut for end in ends[-keep:]]
@@ -6,4 +6,88 @@ class Config:
     SECRET_KEY = SECRET_KEY
     SQLALCHEMY_DATABASE_URI = 'sqlite:///new_site.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    LLAMA_ENDPOINT = os.environ.get('LLAMA_ENDPOINT') or 'http://localhost:11434/api/generate'
\ No newline at end of file
+    # Connections pooled per worker; WAL lets readers run alongside the one
+    # writer, and busy_timeout (ms) makes concurrent writers wait for the
+    # lock instead of failing with "database is locked"
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 20),
+    }
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # safe with WAL; a power cut may lose only the latest commits
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 10000),
+        'cache_size': -1024 * int(os.environ.get('SQLITE_CACHE_MB') or 32),  # negative means KiB
+        'temp_store': 'MEMORY',
+    }
+    # Messages per page of chat history, and chats per page on the home page
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE') or 50)
+    LLAMA_ENDPOINT = os.environ.get('LLAMA_ENDPOINT') or 'http://localhost:11434/api/generate'
+    LLAMA_MODEL = os.environ.get('LLAMA_MODEL') or 'llama3.1'
+    # Seconds; for streamed answers this is the longest allowed gap between tokens
+    LLAMA_TIMEOUT = float(os.environ.get('LLAMA_TIMEOUT') or 30)
+    LLAMA_CONNECT_TIMEOUT = float(os.environ.get('LLAMA_CONNECT_TIMEOUT') or 5)
+    # Generations sent to Ollama at once; others wait in arrival order up to the queue timeout
+    LLAMA_MAX_CONCURRENCY = int(os.environ.get('LLAMA_MAX_CONCURRENCY') or 1)
+    LLAMA_QUEUE_TIMEOUT = float(os.environ.get('LLAMA_QUEUE_TIMEOUT') or 120)
+    # Retries for connection errors and 429/5xx overload responses, with exponential backoff in seconds
+    LLAMA_RETRIES = int(os.environ.get('LLAMA_RETRIES') or 2)
+    LLAMA_BACKOFF = float(os.environ.get('LLAMA_BACKOFF') or 0.5)
+    EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE') or 64)
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL') or 'sentence-transformers/all-MiniLM-L6-v2'
+    # 'torch' (sentence-transformers) or 'onnx' (ONNX Runtime, exported once into EMBED_ONNX_DIR);
+    # EMBED_QUANTIZE runs the ONNX model with int8 weights
+    EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND') or 'torch'
+    EMBED_QUANTIZE = (os.environ.get('EMBED_QUANTIZE') or 'false').lower() in ('1', 'true', 'yes')
+    EMBED_ONNX_DIR = os.environ.get('EMBED_ONNX_DIR') or os.path.join('cache', 'onnx')
+    # ONNX Runtime threads per worker (0 lets it use every core)
+    EMBED_THREADS = int(os.environ.get('EMBED_THREADS') or 0)
+    # Shared embedding server, e.g. unix:///tmp/rag-embed.sock or tcp://127.0.0.1:8765;
+    # empty loads the model in every worker
+    EMBED_SERVER_URL = os.environ.get('EMBED_SERVER_URL') or ''
+    EMBED_SERVER_TIMEOUT = float(os.environ.get('EMBED_SERVER_TIMEOUT') or 30)
+    # Shared across chats; set EMBED_CACHE_DIR to an empty string to disable
+    EMBED_CACHE_DIR = os.environ.get('EMBED_CACHE_DIR', os.path.join('cache', 'embeddings'))
+    EMBED_CACHE_MAX_ENTRIES = int(os.environ.get('EMBED_CACHE_MAX_ENTRIES') or 200000)
+    # Uploads processed concurrently in the background per worker process
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS') or 2)
+    # Processes used for text extraction (defaults to one per core; 0 parses in-process)
+    PARSER_WORKERS = int(os.environ['PARSER_WORKERS']) if os.environ.get('PARSER_WORKERS') else None
+    PDF_PAGES_PER_TASK = int(os.environ.get('PDF_PAGES_PER_TASK') or 32)
+    # Chunk length in tokenizer word-pieces (0 uses the model's max sequence length)
+    CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS') or 0)
+    CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS') or 32)
+    # Vector index tiers by chat size: Flat, then IVF-Flat, then IVF-PQ
+    INDEX_IVF_THRESHOLD = int(os.environ.get('INDEX_IVF_THRESHOLD') or 50000)
+    INDEX_PQ_THRESHOLD = int(os.environ.get('INDEX_PQ_THRESHOLD') or 500000)
+    INDEX_NPROBE = int(os.environ.get('INDEX_NPROBE') or 16)
+    INDEX_PQ_M = int(os.environ.get('INDEX_PQ_M') or 48)
+    # How Flat and IVF-Flat indexes store vectors: 'float32', 'fp16' or 'int8'
+    VECTOR_STORAGE = os.environ.get('VECTOR_STORAGE') or 'float32'
+    # Per-worker LRU caches of query embeddings and top-k results (seconds for TTL)
+    QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE') or 1024)
+    QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL') or 600)
+    # Persistent cache of answers per model, chat, retrieved chunks and question;
+    # empty path disables. A similarity above 0 also reuses answers to near-identical questions.
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', os.path.join('cache', 'responses.sqlite'))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES') or 5000)
+    RESPONSE_CACHE_SIMILARITY = float(os.environ.get('RESPONSE_CACHE_SIMILARITY') or 0)
+    # Prompt size cap in embedding-tokenizer tokens (an estimate of the LLM's count);
+    # retrieved context is packed best-first into what the question and instructions leave
+    PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET') or 1536)
+    # Retrieved chunks at least this similar to a better-ranked one are dropped (1 disables)
+    CONTEXT_DEDUP_SIMILARITY = float(os.environ.get('CONTEXT_DEDUP_SIMILARITY') or 0.95)
+    # Document summaries, stored by content hash
+    SUMMARY_DB = os.environ.get('SUMMARY_DB') or os.path.join('cache', 'summaries.sqlite')
+    # Chunks sampled evenly across a document for its map-reduce summary
+    SUMMARY_SAMPLE_CHUNKS = int(os.environ.get('SUMMARY_SAMPLE_CHUNKS') or 8)
+    SUMMARY_WORKERS = int(os.environ.get('SUMMARY_WORKERS') or 2)
+    # Fuse BM25 keyword matches with vector search, so exact identifiers and codes are found
+    HYBRID_SEARCH = (os.environ.get('HYBRID_SEARCH') or 'true').lower() in ('1', 'true', 'yes')
+    # Load the embedding model and friends in the background at startup instead of on first use
+    WARMUP_ON_START = (os.environ.get('WARMUP_ON_START') or 'false').lower() in ('1', 'true', 'yes')
+    # Prometheus text-format metrics at /metrics (per worker process)
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'true').lower() in ('1', 'true', 'yes')
+    # Lets a request ask for its per-stage timings with ?profile=1 or an X-Profile
+    # header; they come back in a Server-Timing header (and in the stream's done event)
+    REQUEST_PROFILING = (os.environ.get('REQUEST_PROFILING') or 'false').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,100 @@
+import numpy as np
+
+# Turns the ranked chunks retrieved for a question into the context section
+# of the prompt. Near-duplicate chunks (e.g. the same passage in two
+# uploads) are dropped by comparing their stored embeddings, runs of
+# neighbouring chunks from one file are stitched back into a single passage
+# without repeating their overlap, and passages are then added best first
+# until the token budget is spent.
+MIN_OVERLAP_CHARS = 8
+
+
+def join_overlapping(first, second):
+    # Consecutive chunks repeat the end of the previous one; keep it once.
+    tail = first[-len(second):]
+    probe = second[:MIN_OVERLAP_CHARS]
+    start = tail.find(probe)
+    while start != -1:
+        if second.startswith(tail[start:]):
+            return first + second[len(tail) - start:]
+        start = tail.find(probe, start + 1)
+    return first + second
+
+
+class Passage:
+    def __init__(self, chunk):
+        self.filename = chunk['filename']
+        self.first = self.last = chunk['chunk_index']
+        self.text = chunk['chunk_text']
+        self.score = chunk.get('score', 0.0)
+        self.ids = [chunk['id']]
+
+    def extend(self, chunk):
+        self.last = chunk['chunk_index']
+        self.text = join_overlapping(self.text, chunk['chunk_text'])
+        self.score = max(self.score, chunk.get('score', 0.0))
+        self.ids.append(chunk['id'])
+
+    def render(self):
+        return f"Chunk from {self.filename}:\n{self.text}"
+
+
+class ContextBuilder:
+    def __init__(self, count_tokens, token_budget=1536, dedup_similarity=0.95):
+        self.count_tokens = count_tokens  # list of texts -> list of token counts
+        self.token_budget = token_budget
+        self.dedup_similarity = dedup_similarity
+
+    def deduplicate(self, chat_index, chunks):
+        # Keeps chunks in rank order, dropping any whose embedding is at
+        # least `dedup_similarity` similar to one already kept.
+        if len(chunks) < 2 or self.dedup_similarity >= 1:
+            return chunks
+        vectors = chat_index.embeddings([chunk['id'] for chunk in chunks])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ vectors.T
+        kept = []
+        for i, chunk in enumerate(chunks):
+            if not kept or similarity[i, kept].max() < self.dedup_similarity:
+                kept.append(i)
+        return [chunks[i] for i in kept]
+
+    def merge(self, chunks):
+        passages = []
+        by_file = {}
+        for chunk in sorted(chunks, key=lambda c: (c['filename'], c['chunk_index'])):
+            previous = by_file.get(chunk['filename'])
+            if previous is not None and chunk['chunk_index'] == previous.last + 1:
+                previous.extend(chunk)
+            else:
+                by_file[chunk['filename']] = previous = Passage(chunk)
+                passages.append(previous)
+        return sorted(passages, key=lambda p: -p.score)
+
+    def pack(self, passages, budget):
+        # Greedy, best first; a passage that does not fit is skipped so a
+        # smaller, lower-ranked one can still use the room that is left.
+        if not passages:
+            return [], 0
+        rendered = [p.render() for p in passages]
+        costs = self.count_tokens(rendered)
+        packed, used = [], 0
+        for passage, text, cost in zip(passages, rendered, costs):
+            if used + cost <= budget:
+                packed.append((passage, text))
+                used += cost
+        if not packed and budget > 0:
+            # Even the best passage is too long: keep as much of it as fits
+            passage, text, cost = passages[0], rendered[0], costs[0]
+            text = text[:len(text) * budget // cost]
+            packed, used = [(passage, text)], self.count_tokens([text])[0]
+        return packed, used
+
+    def build(self, chat_index, chunks, reserved_tokens=0):
+        # Returns (context text, passages used, context tokens); the budget
+        # left for context is the total minus `reserved_tokens` for the rest
+        # of the prompt.
+        chunks = self.deduplicate(chat_index, chunks)
+        packed, used = self.pack(self.merge(chunks), self.token_budget - reserved_tokens)
+        context = "\n".join(text for _, text in packed)
+        return context, [passage for passage, _ in packed], used
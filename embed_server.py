@@ -0,0 +1,307 @@
+"""Local embedding service shared by all app workers.
+
+One process owns the SentenceTransformer and encodes for every gunicorn
+worker, so workers boot without loading weights and concurrent requests
+are encoded together. Requests arriving within --window-ms of each other
+are merged into one model call of up to --max-batch texts:
+
+    python embed_server.py --url unix:///tmp/rag-embed.sock
+    EMBED_SERVER_URL=unix:///tmp/rag-embed.sock gunicorn app:app -w 4
+
+Workers talk to it through EmbeddingClient, which falls back to loading the
+model in-process while the server is unreachable.
+"""
+import argparse
+from concurrent.futures import Future
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from embeddings import BACKENDS, backend_name, load_embedder
+
+logger = logging.getLogger(__name__)
+
+# Wire format, both directions: a 4-byte big-endian length, then a JSON
+# header of that length. Requests are {"op": "info"} or {"op": "encode",
+# "texts": [...]}; an encode reply is followed by the float32 matrix of
+# shape header["shape"] as raw bytes.
+HEADER = struct.Struct('>I')
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        if not part:
+            raise ConnectionError("Connection closed mid-message")
+        data += part
+    return bytes(data)
+
+
+def send_message(sock, header, payload=b''):
+    body = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body + payload)
+
+
+def recv_message(sock):
+    size, = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return json.loads(_recv_exact(sock, size))
+
+
+def parse_url(url):
+    # unix:///path/to.sock -> (AF_UNIX, path); tcp://host:port -> (AF_INET, (host, port))
+    parsed = urlparse(url)
+    if parsed.scheme == 'unix':
+        return socket.AF_UNIX, parsed.path
+    if parsed.scheme == 'tcp':
+        return socket.AF_INET, (parsed.hostname or '127.0.0.1', parsed.port or 8765)
+    raise ValueError(f"Unsupported embedding server URL {url!r}")
+
+
+class MicroBatcher:
+    # Collects encode requests from many connections and runs them through
+    # the model together: the first request opens a window of `window`
+    # seconds, and everything that arrives before it closes (up to
+    # `max_batch` texts) shares one model call.
+    def __init__(self, encode, window=0.005, max_batch=256):
+        self.encode = encode  # list of texts -> float32 matrix
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, name='embed-batcher', daemon=True).start()
+
+    def submit(self, texts):
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                size += len(pending[-1][0])
+            self._run(pending)
+
+    def _run(self, pending):
+        texts = [text for request, _ in pending for text in request]
+        try:
+            vectors = self.encode(texts)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.texts += len(texts)
+        start = 0
+        for request, future in pending:
+            future.set_result(vectors[start:start + len(request)])
+            start += len(request)
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN  # every worker thread may connect at once
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = socket.SOMAXCONN
+
+
+class EmbeddingServer:
+    def __init__(self, url, model, window=0.005, max_batch=256, batch_size=64):
+        self.url = url
+        self.model = model
+        self.info = {
+            'ok': True,
+            'dim': model.get_sentence_embedding_dimension(),
+            'max_seq_length': model.max_seq_length,
+        }
+        self.batcher = MicroBatcher(self._encode, window, max_batch)
+        self.batch_size = batch_size
+        family, address = parse_url(url)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)  # stale socket from a previous run
+        server_class = _UnixServer if family == socket.AF_UNIX else _TCPServer
+        self.server = server_class(address, self._handler())
+
+    def _encode(self, texts):
+        embeddings = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # One connection serves many requests until the client hangs up
+                while True:
+                    try:
+                        request = recv_message(self.request)
+                    except (ConnectionError, OSError):
+                        return
+                    if request.get('op') == 'info':
+                        send_message(self.request, dict(server.info, batches=server.batcher.batches,
+                                                        texts=server.batcher.texts))
+                        continue
+                    try:
+                        vectors = server.batcher.submit(request['texts']).result()
+                    except Exception as e:
+                        send_message(self.request, {'ok': False, 'error': str(e)})
+                        continue
+                    send_message(self.request, {'ok': True, 'shape': list(vectors.shape)}, vectors.tobytes())
+
+        return Handler
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='embed-server', daemon=True).start()
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class EmbeddingClient:
+    # Stands in for the SentenceTransformer where the app uses one: encode(),
+    # get_sentence_embedding_dimension(), max_seq_length and tokenizer. Only
+    # the tokenizer is loaded locally. While the server is unreachable,
+    # requests go to an in-process model loaded by `load_model` on first
+    # need, and the server is tried again every `retry_after` seconds.
+    def __init__(self, url, load_model, load_tokenizer, timeout=30, retry_after=30):
+        self.url = url
+        self.load_model = load_model
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._down_until = 0.0
+
+        info = self._request({'op': 'info'})
+        if info is None:
+            model = self._local_model()
+            self.dim = model.get_sentence_embedding_dimension()
+            self.max_seq_length = model.max_seq_length
+            self.tokenizer = model.tokenizer
+        else:
+            self.dim = info['dim']
+            self.max_seq_length = info['max_seq_length']
+            self.tokenizer = load_tokenizer()
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            family, address = parse_url(self.url)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(address)
+            except OSError:
+                sock.close()
+                raise
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, header):
+        # Reply header plus matrix for encode, or None if the server can't be reached
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            sock = self._connection()
+            send_message(sock, header)
+            reply = recv_message(sock)
+            if not reply.get('ok'):
+                raise RuntimeError(f"Embedding server error: {reply.get('error')}")
+            if 'shape' in reply:
+                rows, dim = reply['shape']
+                reply['vectors'] = np.frombuffer(_recv_exact(sock, rows * dim * 4), dtype=np.float32).reshape(rows, dim)
+            return reply
+        except (OSError, ConnectionError, ValueError) as e:
+            sock = getattr(self._local, 'sock', None)
+            if sock is not None:
+                sock.close()
+                self._local.sock = None
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning("Embedding server %s unavailable (%s); encoding in-process", self.url, e)
+            return None
+
+    def _local_model(self):
+        with self._fallback_lock:
+            if self._fallback is None:
+                self._fallback = self.load_model()
+            return self._fallback
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        reply = self._request({'op': 'encode', 'texts': texts})
+        if reply is not None:
+            vectors = reply['vectors']
+        else:
+            vectors = self._local_model().encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                                 show_progress_bar=False)
+        return vectors[0] if single else vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=os.environ.get('EMBED_SERVER_URL') or 'unix:///tmp/rag-embed.sock')
+    parser.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL') or 'sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--window-ms', type=float, default=5.0, help='how long a batch waits for more requests')
+    parser.add_argument('--max-batch', type=int, default=256, help='texts per model call')
+    parser.add_argument('--batch-size', type=int, default=64, help='model batch size')
+    # Same settings as the app's, so both name the embedding cache the same way
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get('EMBEDDING_BACKEND') or 'torch')
+    parser.add_argument('--quantize', action='store_true',
+                        default=(os.environ.get('EMBED_QUANTIZE') or 'false').lower() in ('1', 'true', 'yes'),
+                        help='int8 weights (onnx backend)')
+    parser.add_argument('--onnx-dir', default=os.environ.get('EMBED_ONNX_DIR') or os.path.join('cache', 'onnx'))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('EMBED_THREADS') or 0))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    model = load_embedder(args.model, args.backend, quantize=args.quantize, cache_dir=args.onnx_dir,
+                          threads=args.threads)
+    server = EmbeddingServer(args.url, model, window=args.window_ms / 1000,
+                             max_batch=args.max_batch, batch_size=args.batch_size)
+    logger.info("Serving %s (%s) on %s", backend_name(args.model, args.backend, args.quantize), args.backend, args.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
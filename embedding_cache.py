@@ -0,0 +1,125 @@
+import hashlib
+from contextlib import closing
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+# Shared, content-addressed cache of chunk embeddings. Vectors live in one
+# preallocated float32 memmap (one row per slot) so every worker reads them
+# through the same page cache; an SQLite table maps sha256(model, text) to
+# its slot and tracks when it was last used for LRU eviction.
+VECTORS_FILE = 'vectors.f32'
+KEYS_FILE = 'keys.sqlite'
+SQLITE_MAX_VARS = 500
+
+
+def chunk_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, model_name, dim, max_entries=200000):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.root = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+        os.makedirs(self.root, exist_ok=True)
+        self.db_path = os.path.join(self.root, KEYS_FILE)
+
+        vectors_path = os.path.join(self.root, VECTORS_FILE)
+        size = max_entries * dim * 4
+        if not os.path.exists(vectors_path) or os.path.getsize(vectors_path) != size:
+            # Sparse on most filesystems: disk is only used as slots fill up.
+            with open(vectors_path, 'wb') as f:
+                f.truncate(size)
+            # Slots no longer line up with the file. The WAL and shared-memory
+            # files go too, or their frames would be replayed into the new database.
+            for path in (self.db_path, self.db_path + '-wal', self.db_path + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode='r+', shape=(max_entries, dim))
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used)')
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30, isolation_level=None))
+
+    def keys(self, texts):
+        return [chunk_key(self.model_name, text) for text in texts]
+
+    def get_many(self, keys):
+        # Returns {key: vector} for the keys that are cached and bumps their
+        # last-used time. The vectors are copied under the write lock: a
+        # writer in another worker may be evicting these slots and filling
+        # them with new vectors, and the memmap is not part of its
+        # transaction, so an unlocked read could return another chunk's vector.
+        found = {}
+        now = time.time()
+        if not keys:
+            return found
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for start in range(0, len(keys), SQLITE_MAX_VARS):
+                    batch = keys[start:start + SQLITE_MAX_VARS]
+                    marks = ','.join('?' * len(batch))
+                    rows = conn.execute(f'SELECT key, slot FROM entries WHERE key IN ({marks})', batch).fetchall()
+                    if not rows:
+                        continue
+                    slots = np.fromiter((slot for _, slot in rows), dtype=np.int64, count=len(rows))
+                    vectors = np.array(self.vectors[slots])
+                    for (key, _), vector in zip(rows, vectors):
+                        found[key] = vector
+                    conn.execute(f'UPDATE entries SET last_used = ? WHERE key IN ({marks})', [now] + batch)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return found
+
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            # IMMEDIATE takes the write lock up front so two workers can never
+            # hand out the same slot.
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for start in range(0, len(keys), SQLITE_MAX_VARS):
+                    self._put_batch(conn, keys[start:start + SQLITE_MAX_VARS],
+                                    vectors[start:start + SQLITE_MAX_VARS], now)
+                self.vectors.flush()
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _put_batch(self, conn, keys, vectors, now):
+        marks = ','.join('?' * len(keys))
+        existing = {key for key, in conn.execute(f'SELECT key FROM entries WHERE key IN ({marks})', keys)}
+        new = [(key, vector) for key, vector in zip(keys, vectors) if key not in existing]
+        new = list(dict(new).items())
+        if not new:
+            return
+
+        next_slot, = conn.execute('SELECT COALESCE(MAX(slot) + 1, 0) FROM entries').fetchone()
+        fresh = list(range(next_slot, min(self.max_entries, next_slot + len(new))))
+        evict = len(new) - len(fresh)
+        if evict > 0:
+            victims = conn.execute('SELECT key, slot FROM entries ORDER BY last_used LIMIT ?', (evict,)).fetchall()
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in victims])
+            fresh.extend(slot for _, slot in victims)
+        new = new[:len(fresh)]  # only when asked to store more than max_entries at once
+
+        slots = np.array(fresh[:len(new)], dtype=np.int64)
+        self.vectors[slots] = np.asarray([vector for _, vector in new], dtype=np.float32)
+        conn.executemany('INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)',
+                         [(key, int(slot), now) for (key, _), slot in zip(new, slots)])
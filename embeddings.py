@@ -0,0 +1,220 @@
+import inspect
+import json
+import os
+import re
+
+import numpy as np
+
+
+def _encode(model, chunks, batch_size):
+    # One batched call (sentence-transformers sorts by length internally, so
+    # padding stays small) returning a contiguous float32 matrix.
+    embeddings = model.encode(chunks, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def encode_chunks(model, chunks, batch_size=64, cache=None):
+    # Embed chunks into a single float32 matrix that can go straight into
+    # FAISS. With a cache, only chunks it has never seen reach the model.
+    dim = model.get_sentence_embedding_dimension()
+    if not chunks:
+        return np.empty((0, dim), dtype=np.float32)
+    if cache is None:
+        return _encode(model, chunks, batch_size)
+
+    keys = cache.keys(chunks)
+    found = cache.get_many(keys)
+    missing = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in found:
+            missing.setdefault(key, chunk)
+    if missing:
+        encoded = _encode(model, list(missing.values()), batch_size)
+        cache.put_many(list(missing), encoded)
+        found.update(zip(missing, encoded))
+
+    out = np.empty((len(chunks), dim), dtype=np.float32)
+    for row, key in enumerate(keys):
+        out[row] = found[key]
+    return out
+
+
+# Embedding backends. Everything that encodes (encode_chunks, the embedding
+# server, query encoding) only needs the SentenceTransformer surface:
+# encode(), get_sentence_embedding_dimension(), max_seq_length and
+# tokenizer, so a backend is anything that provides those.
+BACKENDS = ('torch', 'onnx')
+ONNX_OPSET = 14
+
+
+def backend_name(model_name, backend='torch', quantize=False):
+    # What embeddings are cached under: the fp32 ONNX export reproduces the
+    # PyTorch vectors, int8 weights don't quite, so they get their own cache
+    if backend == 'onnx' and quantize:
+        return f"{model_name}+int8"
+    return model_name
+
+
+def load_embedder(model_name, backend='torch', quantize=False, cache_dir=None, threads=0):
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == 'onnx':
+        return OnnxEmbedder(model_name, cache_dir or os.path.join('cache', 'onnx'), quantize=quantize, threads=threads)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+def _model_file(model_name, filename):
+    # Path of a file shipped with the model (a local directory or a hub
+    # repository), or None if it has no such file
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, filename)
+        return path if os.path.exists(path) else None
+    from huggingface_hub import hf_hub_download
+    try:
+        return hf_hub_download(model_name, filename)
+    except Exception:
+        return None
+
+
+def _sentence_config(model_name):
+    # (max_seq_length, normalize) as sentence-transformers would load them
+    max_seq_length, normalize = None, False
+    path = _model_file(model_name, 'sentence_bert_config.json')
+    if path:
+        with open(path) as f:
+            max_seq_length = json.load(f).get('max_seq_length')
+    path = _model_file(model_name, 'modules.json')
+    if path:
+        with open(path) as f:
+            normalize = any(module['type'].endswith('Normalize') for module in json.load(f))
+    return max_seq_length, normalize
+
+
+def export_onnx(model_name, path):
+    # One-off: traces the transformer with PyTorch into an ONNX graph that
+    # returns token embeddings; pooling happens in numpy afterwards
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    # Plain matmul/softmax attention: ONNX Runtime optimizes and quantizes it
+    # better than an exported scaled_dot_product_attention
+    model = AutoModel.from_pretrained(model_name, attn_implementation='eager').eval()
+    inputs = AutoTokenizer.from_pretrained(model_name)(['export'], return_tensors='pt')
+    names = list(inputs.keys())
+
+    class TokenEmbeddings(torch.nn.Module):
+        # Positional inputs in `names` order, only the last hidden state out
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(names, args))).last_hidden_state
+
+    axes = {name: {0: 'batch', 1: 'tokens'} for name in names + ['token_embeddings']}
+    # Newer torch defaults to the dynamo exporter, which needs onnxscript; the
+    # TorchScript one handles BERT-style models fine
+    legacy = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(TokenEmbeddings(), tuple(inputs[name] for name in names), tmp, input_names=names,
+                          output_names=['token_embeddings'], dynamic_axes=axes, opset_version=ONNX_OPSET,
+                          **legacy)
+    os.replace(tmp, path)
+
+
+def quantize_onnx(path, quantized_path):
+    # Dynamic quantization: int8 weights for the MatMul/Gemm-heavy layers,
+    # activations quantized on the fly, no calibration data needed
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp = f"{quantized_path}.{os.getpid()}.tmp"
+    quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, quantized_path)
+
+
+class OnnxEmbedder:
+    # all-MiniLM-L6-v2 (or another mean-pooling sentence-transformers model)
+    # on ONNX Runtime. The graph is exported once into `cache_dir`, which is
+    # the only time torch is needed; after that encoding uses just
+    # onnxruntime and the `tokenizers` library. Batches are sorted by length
+    # and padded per batch, like sentence-transformers does.
+    def __init__(self, model_name, cache_dir, quantize=False, threads=0):
+        import onnxruntime
+
+        root = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, 'model.onnx')
+        if not os.path.exists(path):
+            export_onnx(model_name, path)
+        if quantize:
+            quantized_path = os.path.join(root, 'model.int8.onnx')
+            if not os.path.exists(quantized_path):
+                quantize_onnx(path, quantized_path)
+            path = quantized_path
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.dim = self.session.get_outputs()[0].shape[-1]
+        self.model_name = model_name
+        self.model_path = path
+        self._tokenizer = None
+
+        max_seq_length, self.normalize = _sentence_config(model_name)
+        tokenizer_config = {}
+        path = _model_file(model_name, 'tokenizer_config.json')
+        if path:
+            with open(path) as f:
+                tokenizer_config = json.load(f)
+        path = _model_file(model_name, 'tokenizer.json')
+        if path:
+            from tokenizers import Tokenizer
+            self.fast_tokenizer = Tokenizer.from_file(path)
+        else:
+            self.fast_tokenizer = self.tokenizer.backend_tokenizer
+        self.max_seq_length = max_seq_length or tokenizer_config.get('model_max_length') or 512
+        pad_token = tokenizer_config.get('pad_token') or '[PAD]'
+        self.fast_tokenizer.enable_truncation(self.max_seq_length)
+        self.fast_tokenizer.enable_padding(pad_id=self.fast_tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+    @property
+    def tokenizer(self):
+        # The transformers tokenizer, only for callers that need its API (the
+        # chunker); loaded on first use
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _encode_batch(self, texts):
+        encodings = self.fast_tokenizer.encode_batch(texts)
+        columns = {
+            'input_ids': [e.ids for e in encodings],
+            'attention_mask': [e.attention_mask for e in encodings],
+            'token_type_ids': [e.type_ids for e in encodings],
+        }
+        feed = {name: np.asarray(columns[name], dtype=np.int64) for name in self.input_names}
+        tokens = self.session.run(None, feed)[0]
+        mask = np.asarray(columns['attention_mask'], dtype=np.float32)[..., None]
+        pooled = (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._encode_batch([texts[i] for i in rows])
+        return out[0] if single else out
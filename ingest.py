@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import batched
+from metrics import registry, span
+
+logger = logging.getLogger(__name__)
+
+# Job states and per-file stages, in the order a file moves through them
+QUEUED = 'queued'
+RUNNING = 'running'
+PARSING = 'parsing'
+EMBEDDING = 'embedding'
+INDEXING = 'indexing'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+CHUNKS_EMBEDDED = registry.counter('rag_ingest_chunks_total', 'Chunks embedded and spooled by uploads')
+FILES = registry.counter('rag_ingest_files_total', 'Uploaded files processed, by final stage', ['stage'])
+
+# What the prefetch thread passes along, in order: a file, then its
+# segments up to END (or FAILED when reading them raised), and STOP after
+# the last file (or BROKEN when the parse iterator itself raised)
+_FILE, _SEGMENT, _END, _FAILED, _STOP, _BROKEN = range(6)
+
+
+class Prefetcher:
+    # Reads `parsed`, an iterator of (filename, doc) whose docs carry a lazy
+    # `segments` iterator, on its own thread and up to `max_segments`
+    # segments ahead, so the next file is read and parsed while the current
+    # one is chunked and embedded, whatever its format and whether or not
+    # the parser has a process pool. Yields the same (filename, doc) pairs;
+    # a doc's segments must be read or abandoned before the next pair.
+    def __init__(self, parsed, max_segments=256):
+        self._queue = queue.Queue(max_segments)
+        self._stop = threading.Event()
+        self._open = False  # segments of the last doc not read to the end
+        threading.Thread(target=self._produce, args=(parsed,), name='ingest-prefetch', daemon=True).start()
+
+    def _put(self, kind, value=None):
+        while not self._stop.is_set():
+            try:
+                self._queue.put((kind, value), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False  # the consumer has gone
+
+    def _produce(self, parsed):
+        try:
+            for filename, doc in parsed:
+                if not isinstance(doc, dict):
+                    if not self._put(_FILE, (filename, doc)):
+                        return
+                    continue
+                if not self._put(_FILE, (filename, dict(doc, segments=None))):
+                    return
+                try:
+                    for segment in doc['segments']:
+                        if not self._put(_SEGMENT, segment):
+                            return
+                except Exception as e:
+                    if not self._put(_FAILED, e):
+                        return
+                    continue
+                if not self._put(_END):
+                    return
+        except Exception as e:
+            self._put(_BROKEN, e)
+            return
+        self._put(_STOP)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self._open:
+            # Skip what is left of a doc the consumer gave up on
+            kind, _ = self._queue.get()
+            self._open = kind == _SEGMENT
+        kind, value = self._queue.get()
+        if kind == _STOP:
+            raise StopIteration
+        if kind == _BROKEN:
+            raise value
+        filename, doc = value
+        if isinstance(doc, dict):
+            self._open = True
+            doc['segments'] = self._segments()
+        return filename, doc
+
+    def _segments(self):
+        while self._open:
+            kind, value = self._queue.get()
+            if kind == _SEGMENT:
+                yield value
+                continue
+            self._open = False
+            if kind == _FAILED:
+                raise value
+
+    def close(self):
+        self._stop.set()
+
+
+class IngestPipeline:
+    # Runs uploads in the background as a staged, streaming pipeline. A
+    # prefetch thread (and the parser pool behind it) works ahead on later
+    # pages and files while each document flows through extract -> chunk -> embed in batches of `batch_size`
+    # chunks; embedded batches are spooled to disk and the document is
+    # published to the chat index once complete, so memory is bounded by the
+    # batch rather than the document. Once a document is spooled it is
+    # handed to `summarize`, which must not block on the LLM. At most
+    # `max_workers` jobs run at once; the rest wait in the executor's queue.
+    #
+    # Job state is written to <jobs_dir>/<job_id>.json on every change, so
+    # any worker process can answer a status request.
+    def __init__(self, jobs_dir, parse, chunk, embed, summarize, spool, index,
+                 batch_size=64, max_workers=2, job_ttl=24 * 3600, prefetch_segments=256):
+        self.jobs_dir = jobs_dir
+        self.parse = parse            # (chat_id, files) -> iterator of (filename, doc | None | exception)
+        self.chunk = chunk            # (segments) -> iterator of chunk texts
+        self.embed = embed            # (chunks) -> float32 matrix
+        self.summarize = summarize    # (doc) -> None, starts a background summary
+        self.spool = spool            # (chat_id) -> ChunkSpool
+        self.index = index            # (chat_id, doc) -> None
+        self.batch_size = batch_size
+        self.prefetch_segments = prefetch_segments
+        self.job_ttl = job_ttl
+        self._jobs = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def submit(self, chat_id, files):
+        # `files` is a list of (filename, path) pairs already saved to disk.
+        self._prune()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'chat_id': chat_id,
+            'state': QUEUED,
+            'created': time.time(),
+            'files': [{'filename': filename, 'stage': QUEUED, 'chunks': 0, 'error': None}
+                      for filename, _ in files],
+        }
+        lock = threading.Lock()
+        self._save(job, lock)
+        self._jobs.submit(self._run, job, files, lock)
+        return job['job_id']
+
+    def status(self, job_id):
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, os.path.basename(job_id) + '.json')
+
+    def _save(self, job, lock):
+        with lock:
+            tmp = self._path(job['job_id']) + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(job, f)
+            os.replace(tmp, self._path(job['job_id']))
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _run(self, job, files, lock):
+        def update(entry, stage, error=None):
+            entry['stage'] = stage
+            entry['error'] = error
+            self._save(job, lock)
+
+        job['state'] = RUNNING
+        entries = iter(job['files'])
+        parsed = Prefetcher(self.parse(job['chat_id'], files), self.prefetch_segments)
+        try:
+            self._run_files(job, entries, parsed, update)
+        finally:
+            parsed.close()
+        job['state'] = DONE
+        job['finished'] = time.time()
+        self._save(job, lock)
+
+    def _run_files(self, job, entries, parsed, update):
+        for entry in entries:
+            update(entry, PARSING)
+            try:
+                with span('parse'):
+                    _, doc = next(parsed)
+            except Exception as e:
+                # The parse iterator itself broke: nothing after this can be parsed
+                logger.exception("Failed to parse uploads for chat %s", job['chat_id'])
+                for failed in [entry] + list(entries):
+                    update(failed, FAILED, str(e))
+                    FILES.inc(stage=FAILED)
+                break
+            if isinstance(doc, Exception):
+                update(entry, FAILED, str(doc))
+            elif doc is None:
+                update(entry, SKIPPED)
+            else:
+                self._ingest(job, entry, doc, update)
+            FILES.inc(stage=entry['stage'])
+
+    def _ingest(self, job, entry, doc, update):
+        spool = self.spool(job['chat_id'])
+        try:
+            # Chunking is lazy, so pulling the next batch is what runs it
+            batches = batched(self.chunk(doc['segments']), self.batch_size)
+            while True:
+                with span('chunk'):
+                    batch = next(batches, None)
+                if batch is None:
+                    break
+                with span('embed'):
+                    vectors = self.embed(batch)
+                with span('spool'):
+                    spool.append(batch, vectors)
+                CHUNKS_EMBEDDED.inc(len(batch))
+                entry['chunks'] = spool.count
+                update(entry, EMBEDDING)
+            spool.close()
+            doc['spool'] = spool
+            try:
+                self.summarize(doc)
+            except Exception:
+                # A failed summary should not keep an otherwise good file out of the index
+                logger.exception("Failed to summarize %s", entry['filename'])
+            update(entry, INDEXING)
+            with span('index'):
+                self.index(job['chat_id'], doc)
+            update(entry, DONE)
+        except Exception as e:
+            logger.exception("Failed to ingest %s", entry['filename'])
+            update(entry, FAILED, str(e))
+        finally:
+            spool.discard()
@@ -0,0 +1,169 @@
+from collections import Counter
+import hashlib
+import os
+import re
+
+import numpy as np
+
+# BM25 over a chat's chunks, stored next to the vector index in each
+# generation directory. Terms are identified by a 64-bit hash of the
+# casefolded term, so there is no vocabulary to keep in sync. Postings are
+# three parallel arrays sorted by term -- term-major, then chunk position --
+# and `terms`/`starts` give each distinct term's slice of them:
+#
+#   lex_terms.npy    int64   distinct term hashes, sorted
+#   lex_starts.npy   int64   posting offset of each term, plus the total
+#   lex_docs.npy     int32   chunk position of each posting
+#   lex_tfs.npy      uint16  term frequency of each posting
+#   lex_lengths.npy  int32   terms per chunk, by chunk position
+#
+# A query looks up its few terms with a binary search and scores only their
+# postings, all in numpy.
+LEXICAL_FILES = ('terms', 'starts', 'docs', 'tfs', 'lengths')
+DTYPES = {'terms': np.int64, 'starts': np.int64, 'docs': np.int32, 'tfs': np.uint16, 'lengths': np.int32}
+TOKEN_RE = re.compile(r'\w+(?:[-./:]\w+)*')
+SPLIT_RE = re.compile(r'[-./:_]+')
+K1 = 1.2
+B = 0.75
+RRF_K = 60
+
+
+def tokenize(text):
+    # Words and identifiers such as "E1234", "ab-1234" or "v2.1.0"; compound
+    # identifiers also yield their parts, so "ab-1234" matches "1234".
+    for match in TOKEN_RE.finditer(text.casefold()):
+        token = match.group()
+        yield token
+        if not token.isalnum():
+            for part in SPLIT_RE.split(token):
+                if part and part != token:
+                    yield part
+
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _hashes(terms, memo):
+    out = np.empty(len(terms), dtype=np.int64)
+    for i, term in enumerate(terms):
+        value = memo.get(term)
+        if value is None:
+            value = memo[term] = term_hash(term)
+        out[i] = value
+    return out
+
+
+def postings(texts, first_position=0):
+    # (terms, docs, tfs, lengths) for consecutive chunks starting at
+    # `first_position`, unsorted
+    terms, docs, tfs, lengths = [], [], [], []
+    memo = {}
+    for position, text in enumerate(texts, first_position):
+        counts = Counter(tokenize(text))
+        lengths.append(sum(counts.values()))
+        if counts:
+            terms.append(_hashes(list(counts), memo))
+            docs.append(np.full(len(counts), position, dtype=np.int32))
+            tfs.append(np.minimum(np.fromiter(counts.values(), dtype=np.int64, count=len(counts)), 65535))
+    if not terms:
+        return (np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.uint16),
+                np.asarray(lengths, dtype=np.int32))
+    return (np.concatenate(terms), np.concatenate(docs), np.concatenate(tfs).astype(np.uint16),
+            np.asarray(lengths, dtype=np.int32))
+
+
+def rrf(rankings, k=RRF_K):
+    # Reciprocal rank fusion: {key: sum of 1 / (k + rank)} over the rankings
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+class LexicalIndex:
+    def __init__(self, terms, starts, docs, tfs, lengths):
+        self.terms = terms
+        self.starts = starts
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.avgdl = float(np.mean(lengths)) if len(lengths) else 0.0
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        paths = [os.path.join(directory, f"lex_{name}.npy") for name in LEXICAL_FILES]
+        if not all(os.path.exists(path) for path in paths):
+            return None  # written before lexical search existed
+        return cls(*(np.load(path, mmap_mode='r' if mmap else None) for path in paths))
+
+    def save(self, directory):
+        for name in LEXICAL_FILES:
+            np.save(os.path.join(directory, f"lex_{name}.npy"), np.asarray(getattr(self, name), dtype=DTYPES[name]))
+
+    @classmethod
+    def from_postings(cls, terms, docs, tfs, lengths):
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        boundaries = np.flatnonzero(np.diff(terms)) + 1
+        starts = np.concatenate(([0], boundaries, [len(terms)])).astype(np.int64) if len(terms) else np.zeros(1, np.int64)
+        return cls(terms[starts[:-1]] if len(terms) else np.empty(0, np.int64), starts, docs, tfs, lengths)
+
+    @classmethod
+    def empty(cls):
+        return cls.from_postings(np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.uint16),
+                                 np.empty(0, np.int32))
+
+    def expanded(self):
+        # Postings with their term repeated per posting, as postings() returns
+        counts = np.diff(np.asarray(self.starts))
+        return np.repeat(np.asarray(self.terms), counts), np.asarray(self.docs), np.asarray(self.tfs)
+
+    def compact(self, keep):
+        # Drops the chunks where `keep` is False and renumbers the rest
+        terms, docs, tfs = self.expanded()
+        position = np.cumsum(keep, dtype=np.int64) - 1
+        kept = keep[docs]
+        return LexicalIndex.from_postings(terms[kept], position[docs[kept]].astype(np.int32), tfs[kept],
+                                          np.asarray(self.lengths)[keep])
+
+    def extend(self, parts):
+        # Adds postings() results for chunks appended after the current ones
+        if not parts:
+            return self
+        terms, docs, tfs = self.expanded()
+        return LexicalIndex.from_postings(
+            np.concatenate([terms] + [p[0] for p in parts]),
+            np.concatenate([docs] + [p[1] for p in parts]),
+            np.concatenate([tfs] + [p[2] for p in parts]),
+            np.concatenate([np.asarray(self.lengths)] + [p[3] for p in parts]))
+
+    def search(self, query, k=50):
+        # (chunk positions, BM25 scores), best first
+        n = len(self.lengths)
+        hashes = np.unique(_hashes(list(set(tokenize(query))), {}))
+        if not n or not len(hashes) or not len(self.terms):
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        at = np.searchsorted(self.terms, hashes)
+        found = at < len(self.terms)
+        found[found] = self.terms[at[found]] == hashes[found]
+        at = at[found]
+        if not len(at):
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        starts, ends = np.asarray(self.starts)[at], np.asarray(self.starts)[at + 1]
+        df = ends - starts
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        docs = np.concatenate([self.docs[s:e] for s, e in zip(starts, ends)])
+        tfs = np.concatenate([self.tfs[s:e] for s, e in zip(starts, ends)]).astype(np.float32)
+        weights = np.repeat(idf, df).astype(np.float32)
+        norm = K1 * (1 - B + B * np.asarray(self.lengths)[docs] / (self.avgdl or 1.0))
+        scores = weights * tfs * (K1 + 1) / (tfs + norm)
+
+        totals = np.bincount(docs, weights=scores, minlength=n)
+        positions = np.flatnonzero(totals)
+        if len(positions) > k:
+            positions = positions[np.argpartition(-totals[positions], k - 1)[:k]]
+        positions = positions[np.argsort(-totals[positions], kind='stable')]
+        return positions.astype(np.int64), totals[positions].astype(np.float32)
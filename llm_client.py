@@ -0,0 +1,200 @@
+from collections import deque
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Client for the Ollama generate endpoint shared by chat and summaries. One
+# keep-alive session is reused across threads, and a fair semaphore caps the
+# number of generations running at once: a single local Ollama serializes
+# them anyway, so extra concurrency only makes every request time out together.
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class LLMBusyError(requests.exceptions.RequestException):
+    # Raised when no generation slot frees up within the queue timeout.
+    pass
+
+
+class FairSemaphore:
+    # Counting semaphore that grants slots strictly in arrival order.
+    def __init__(self, value):
+        self._value = value
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return True
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        if waiter.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.is_set():
+                return True  # handed a slot just as the wait timed out
+            self._waiters.remove(waiter)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().set()  # pass the slot on directly
+            else:
+                self._value += 1
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'max_ms': self.max * 1000,
+        }
+
+
+class LLMClient:
+    def __init__(self, endpoint, model, timeout=30, connect_timeout=5, max_concurrency=1,
+                 queue_timeout=120, retries=2, backoff=0.5):
+        self.endpoint = endpoint
+        self.model = model
+        self.timeout = (connect_timeout, timeout)
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.slots = FairSemaphore(max_concurrency)
+
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.retried = 0
+        self.rejected = 0
+        self.queue_wait = Timing()
+        self.first_token = Timing()
+        self.generation = Timing()
+
+    def _record(self, timing, seconds):
+        with self._stats_lock:
+            timing.add(seconds)
+
+    def _acquire(self):
+        start = time.perf_counter()
+        if not self.slots.acquire(self.queue_timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            raise LLMBusyError(f"No generation slot free after {self.queue_timeout}s")
+        self._record(self.queue_wait, time.perf_counter() - start)
+        with self._stats_lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def _release(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def _post(self, prompt, stream):
+        # Retries connection failures and overload statuses with exponential
+        # backoff; a read timeout is not retried since the model was busy
+        # generating and would only be asked to start over.
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.endpoint,
+                                             json={"model": self.model, "prompt": prompt, "stream": stream},
+                                             stream=stream, timeout=self.timeout)
+                if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                    response.close()
+                else:
+                    response.raise_for_status()
+                    return response
+            except requests.ConnectionError:
+                if attempt == self.retries:
+                    raise
+            with self._stats_lock:
+                self.retried += 1
+            time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def generate(self, prompt):
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            response = self._post(prompt, stream=False)
+            data = response.json()
+            if 'response' not in data:
+                raise KeyError("'response' key not found in API response")
+            self._record(self.generation, time.perf_counter() - start)
+            return data['response']
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            self._release()
+
+    def stream(self, prompt):
+        # Yields response tokens as Ollama produces them. The slot is held
+        # until the stream ends or the consumer closes the generator.
+        self._acquire()
+        start = time.perf_counter()
+        first = True
+        try:
+            with self._post(prompt, stream=True) as response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    part = json.loads(line)
+                    if 'error' in part:
+                        raise KeyError(part['error'])
+                    token = part.get('response', '')
+                    if token:
+                        if first:
+                            self._record(self.first_token, time.perf_counter() - start)
+                            first = False
+                        yield token
+                    if part.get('done'):
+                        break
+            self._record(self.generation, time.perf_counter() - start)
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'in_flight': self.in_flight,
+                'queued': self.slots.queued,
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retried,
+                'rejected': self.rejected,
+                'queue_wait': self.queue_wait.stats(),
+                'first_token': self.first_token.stats(),
+                'generation': self.generation.stats(),
+            }
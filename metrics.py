@@ -0,0 +1,175 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+# In-process metrics in the Prometheus text format, without a client
+# library: counters, histograms, and collectors that read numbers other
+# objects already keep (cache hit counts, LLM queue depth) at scrape time.
+# Each worker process has its own registry, so with several gunicorn
+# workers a scrape sees the worker that served it.
+#
+# Pipeline stages are timed with span(): every stage feeds one
+# `rag_stage_seconds{stage=...}` histogram, the per-request profile when
+# one is active (see start_profile), and any subscribers (the benchmark
+# harness uses that to collect exact percentiles).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 1536, 2048, 4096, 8192)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        at = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][at] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _labels(self.labels + ('le',), key + (_number(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._subscribers = []
+        self._local = threading.local()
+        self.stage_seconds = self.histogram('rag_stage_seconds', 'Time spent in each pipeline stage', ['stage'])
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect):
+        # `collect()` returns (name, type, help, [(labels dict, value), ...])
+        # tuples, read at every scrape
+        self._collectors.append(collect)
+
+    def subscribe(self, listener):
+        # listener(stage, seconds) is called for every recorded stage
+        self._subscribers.append(listener)
+
+    def record(self, stage, seconds):
+        self.stage_seconds.observe(seconds, stage=stage)
+        profile = getattr(self._local, 'profile', None)
+        if profile is not None:
+            profile.append((stage, seconds))
+        for listener in self._subscribers:
+            listener(stage, seconds)
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def start_profile(self, profile=None):
+        # Collects this thread's stages until end_profile(); passing the list
+        # from current_profile() continues a profile on another thread
+        self._local.profile = [] if profile is None else profile
+
+    def current_profile(self):
+        return getattr(self._local, 'profile', None)
+
+    def end_profile(self):
+        profile = getattr(self._local, 'profile', None)
+        self._local.profile = None
+        return profile
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def server_timing(profile):
+    # Server-Timing header value, one entry per stage with durations summed
+    totals = {}
+    for stage, seconds in profile:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ', '.join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+
+registry = Registry()
+span = registry.span
+record = registry.record
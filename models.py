@@ -1,10 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
 from datetime import datetime
 import json
+import sqlite3
 
 db = SQLAlchemy()
 
+def configure_sqlite(engine, pragmas):
+    # Applies PRAGMAs (journal_mode=WAL, busy_timeout, ...) to every new
+    # connection of a SQLite engine; other databases are left alone
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), nullable=False, unique=True)
@@ -15,16 +29,29 @@ class User(UserMixin, db.Model):
 class Chat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     messages = db.relationship('Message', backref='chat', lazy=True, cascade="all, delete-orphan")
 
 class Message(db.Model):
+    # History is read newest first, a page at a time, by (chat_id, timestamp)
+    __table_args__ = (db.Index('ix_message_chat_id_timestamp', 'chat_id', 'timestamp'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    content = db.Column(db.Text, nullable=False)
+    content = db.Column(db.Text, nullable=False)  # rendered HTML for bot answers
+    raw_content = db.Column(db.Text)  # a bot answer as the model wrote it
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_user = db.Column(db.Boolean, default=True)
     chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), nullable=False)
     citations = db.Column(db.Text)
 
     def get_citations(self):
-        return json.loads(self.citations) if self.citations else []
\ No newline at end of file
+        return json.loads(self.citations) if self.citations else []
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'content': self.content,
+            'is_user': self.is_user,
+            'citations': self.get_citations(),
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+        }
@@ -0,0 +1,257 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Format libraries are imported by the branch that needs them, so a worker
+# only loads pandas, python-docx and the rest once such a file arrives.
+TEXT_BLOCK_SIZE = 64 * 1024
+EXCEL_ROWS_PER_SEGMENT = 1000
+SPOOL_BATCH_CHARS = 1024 * 1024
+SPOOL_PREFIX = 'segments-'
+
+
+def iter_segments(file_path):
+    # Yields a document's text piece by piece (pages, paragraphs, slides,
+    # sheet rows) so callers never have to hold the whole text at once.
+    # Joining every segment gives the document's full text.
+    _, file_extension = os.path.splitext(file_path)
+
+    if file_extension == '.pdf':
+        import PyPDF2
+        with open(file_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            for page in reader.pages:
+                yield page.extract_text()
+    elif file_extension in ['.doc', '.docx']:
+        import docx
+        doc = docx.Document(file_path)
+        for i, paragraph in enumerate(doc.paragraphs):
+            yield paragraph.text if i == 0 else "\n" + paragraph.text
+    elif file_extension == '.xlsx':
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                yield "\t".join('' if value is None else str(value) for value in row) + "\n"
+        finally:
+            workbook.close()
+    elif file_extension == '.xls':
+        import pandas as pd
+        df = pd.read_excel(file_path)
+        for start in range(0, len(df), EXCEL_ROWS_PER_SEGMENT):
+            yield df.iloc[start:start + EXCEL_ROWS_PER_SEGMENT].to_string(header=start == 0) + "\n"
+    elif file_extension in ['.ppt', '.pptx']:
+        from pptx import Presentation
+        prs = Presentation(file_path)
+        for slide in prs.slides:
+            for shape in slide.shapes:
+                if hasattr(shape, 'text'):
+                    yield shape.text + "\n"
+    elif file_extension == '.txt':
+        with open(file_path, 'r') as file:
+            for block in iter(lambda: file.read(TEXT_BLOCK_SIZE), ''):
+                yield block
+
+
+def extract_text(file_path):
+    return ''.join(iter_segments(file_path))
+
+
+def extract_pdf_pages(file_path, start, stop):
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [page.extract_text() for page in reader.pages[start:stop]]
+
+
+def spool_segments(file_path, spool_path):
+    # Pool task for formats that can't be split into ranges up front: writes
+    # the file's segments to `spool_path` a batch at a time as they are
+    # extracted, so neither process holds the whole text.
+    try:
+        with open(spool_path, 'wb') as f:
+            batch, size = [], 0
+            for segment in iter_segments(file_path):
+                batch.append(segment)
+                size += len(segment)
+                if size >= SPOOL_BATCH_CHARS:
+                    pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                    batch, size = [], 0
+            if batch:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        _remove(spool_path)
+        raise
+    return SpooledSegments(spool_path)
+
+
+class SpooledSegments:
+    # A spool_segments result: iterating reads the segments back a batch at
+    # a time and deletes the file once done or abandoned
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        try:
+            with open(self.path, 'rb') as f:
+                while True:
+                    try:
+                        batch = pickle.load(f)
+                    except EOFError:
+                        return
+                    yield from batch
+        finally:
+            self.discard()
+
+    def discard(self):
+        _remove(self.path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def pdf_page_count(file_path):
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+class DocumentParser:
+    # Fans text extraction out over a process pool: one task per file, and
+    # PDFs are further split into page ranges so one large PDF can use every
+    # core. Other formats are extracted whole by their libraries, so their
+    # task spools segments to a temporary file in `spool_dir` in batches
+    # and the consumer streams them back from there rather than receiving
+    # the whole text in one piece. Only a bounded window of tasks is in
+    # flight at a time, so the pool works ahead of the consumer without the
+    # whole upload piling up. Results always come back in file and page
+    # order. With max_workers=0 everything runs lazily in the calling process.
+    def __init__(self, max_workers=None, pdf_pages_per_task=32, tasks_in_flight=None, spool_dir=None):
+        self.max_workers = max_workers
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.tasks_in_flight = tasks_in_flight or 2 * (max_workers or os.cpu_count())
+        self.spool_dir = spool_dir or tempfile.gettempdir()
+        self._pool = None
+        self._pool_pid = None
+
+    def _executor(self):
+        # Created on first use, and again after a fork, so each gunicorn
+        # worker owns its pool. Workers are started from a fork server (or
+        # spawned) rather than forked from this process, whose other threads
+        # may hold locks at the moment of a fork.
+        if self._pool is None or self._pool_pid != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers or os.cpu_count(), mp_context=context)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def _tasks(self, file_path):
+        # (function, args) pairs whose results, concatenated in order, are
+        # the file's segments.
+        if file_path.endswith('.txt'):
+            return [None]  # plain reads gain nothing from a pool; streamed in-process
+        if file_path.endswith('.pdf'):
+            pages = pdf_page_count(file_path)
+            step = self.pdf_pages_per_task
+            return [(extract_pdf_pages, (file_path, start, min(start + step, pages)))
+                    for start in range(0, pages, step)]
+        return [(spool_segments, (file_path, None))]
+
+    def parse(self, file_path):
+        for _, segments in self.iter_parse([file_path]):
+            return ''.join(segments)
+
+    def iter_parse(self, file_paths):
+        # Yields (file_path, segments) in order, where `segments` is a lazy
+        # iterator over that file's text. Each file's segments must be read
+        # (or abandoned) before asking for the next file; a parse error is
+        # raised from the segments iterator.
+        if self.max_workers == 0:
+            for file_path in file_paths:
+                yield file_path, iter_segments(file_path)
+            return
+
+        window = deque()
+        pending = ((i, task) for i, path in enumerate(file_paths) for task in self._file_tasks(path))
+
+        def fill(current):
+            while len(window) < self.tasks_in_flight:
+                item = next(pending, None)
+                if item is None:
+                    return
+                i, task = item
+                if i < current:
+                    continue
+                window.append((i, self._start(task)))
+
+        def segments(current, file_path):
+            while True:
+                fill(current)
+                if not window or window[0][0] != current:
+                    return
+                _, future = window.popleft()
+                result = future.result()
+                if result is None:
+                    yield from iter_segments(file_path)
+                else:
+                    yield from result
+
+        try:
+            for i, file_path in enumerate(file_paths):
+                while window and window[0][0] < i:
+                    _abandon(window.popleft()[1])  # leftovers of a file the consumer abandoned
+                yield file_path, segments(i, file_path)
+        finally:
+            while window:
+                _abandon(window.popleft()[1])
+
+    def _file_tasks(self, file_path):
+        try:
+            return self._tasks(file_path)
+        except Exception as e:
+            return [_Failed(e)]
+
+    def _start(self, task):
+        if task is None:
+            return _Done(None)
+        if isinstance(task, _Failed):
+            return task
+        fn, args = task
+        if fn is spool_segments:
+            fd, spool_path = tempfile.mkstemp(prefix=SPOOL_PREFIX, dir=self.spool_dir)
+            os.close(fd)
+            args = (args[0], spool_path)
+        return self._executor().submit(fn, *args)
+
+
+def _abandon(future):
+    # Deletes a spooled result nobody is going to read
+    def discard(future):
+        if not future.cancelled() and future.exception() is None and isinstance(future.result(), SpooledSegments):
+            future.result().discard()
+    future.add_done_callback(discard)
+
+
+class _Done:
+    # Already-computed result with the Future.result() interface
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+    def result(self):
+        raise self.error
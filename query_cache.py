@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    # Thread-safe LRU cache whose entries also expire `ttl` seconds after
+    # they were stored. Keeps hit/miss counters for the stats endpoint.
+    def __init__(self, maxsize=1024, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]  # expired
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate):
+        # Removes every entry whose key matches
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def normalize_query(text):
+    return ' '.join(text.split())
+
+
+class QueryCache:
+    # Two caches in front of retrieval: query text -> embedding, and
+    # (chat index, epoch, generation, query, k) -> top-k chunk ids and scores.
+    # The generation is bumped on every index write and a recreated index gets
+    # a new epoch, so results for a changed chat simply stop matching and age
+    # out of the LRU.
+    def __init__(self, maxsize=1024, ttl=600):
+        self.embeddings = LRUCache(maxsize, ttl)
+        self.results = LRUCache(maxsize, ttl)
+
+    def embed(self, query, encode):
+        query = normalize_query(query)
+        embedding = self.embeddings.get(query)
+        if embedding is None:
+            embedding = encode(query)
+            self.embeddings.put(query, embedding)
+        return embedding
+
+    def search(self, chat_index, query, encode, k=10, hybrid=True):
+        query = normalize_query(query)
+        key = (chat_index.root, chat_index.epoch, chat_index.generation, query, k)
+        hits = self.results.get(key)
+        if hits is not None:
+            try:
+                return [dict(chat_index.chunk_by_id(i), score=score) for i, score in hits]
+            except KeyError:
+                pass  # chunks no longer in the index: search again
+
+        chunks = chat_index.search(self.embed(query, encode), k=k, query_text=query if hybrid else None)
+        self.results.put(key, [(chunk['id'], chunk['score']) for chunk in chunks])
+        return chunks
+
+    def drop(self, root):
+        # Forgets the results for a chat's index, e.g. when it is deleted
+        self.results.discard(lambda key: key[0] == root)
+
+    def stats(self):
+        return {'query_embeddings': self.embeddings.stats(), 'retrieval_results': self.results.stats()}
@@ -0,0 +1,133 @@
+import re
+
+# Renders the markdown subset the bot answers in -- numbered and bulleted
+# lists, pipe tables, **bold** and *italic* -- to HTML in a single pass,
+# one line at a time. Each line is classified by an anchored pattern and
+# its emphasis is paired in one scan, so the cost is linear in the length
+# of the answer however it is formatted. Plain lines are joined with <br>.
+# As before, text is not HTML-escaped.
+#
+# Renderer takes the answer in pieces as it streams in and returns the
+# HTML of each line as soon as it is complete; render() does a whole
+# answer at once. Both give the same HTML.
+ORDERED_RE = re.compile(r'\s*\d+[.)]\s')
+BULLET_RE = re.compile(r'\s*(?:•|[-*+]\s)')
+SEPARATOR_RE = re.compile(r'\s*:?-+:?\s*')
+EMPHASIS_RE = re.compile(r'(\*\*|\*)')
+TABLE_OPEN = '<table class="border-collapse border border-gray-400 w-full">'
+CELL_CLASS = 'border border-gray-400 px-4 py-2'
+EMPHASIS_TAGS = {'**': 'strong', '*': 'em'}
+
+
+def render(text):
+    renderer = Renderer()
+    return renderer.feed(text) + renderer.close()
+
+
+def inline(text):
+    # **bold** and *italic*; a marker only opens if a matching one follows
+    # later in the line, otherwise it stays a literal asterisk
+    parts = EMPHASIS_RE.split(text)
+    if len(parts) == 1:
+        return text
+    remaining = {'**': parts.count('**'), '*': parts.count('*')}
+    open_tags = set()
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            out.append(part)
+            continue
+        remaining[part] -= 1
+        tag = EMPHASIS_TAGS[part]
+        if part in open_tags:
+            open_tags.discard(part)
+            out.append(f'</{tag}>')
+        elif remaining[part]:
+            open_tags.add(part)
+            out.append(f'<{tag}>')
+        else:
+            out.append(part)
+    return ''.join(out)
+
+
+def _cells(line):
+    # Cells of a pipe table row, or None if the line isn't one
+    if '|' not in line:
+        return None
+    row = line.strip()
+    if row.startswith('|'):
+        row = row[1:]
+    if row.endswith('|'):
+        row = row[:-1]
+    cells = row.split('|')
+    return cells if len(cells) > 1 else None
+
+
+class Renderer:
+    def __init__(self):
+        self._pending = []  # pieces of the line still being received
+        self._block = None  # 'ol', 'ul', 'table' or 'text': what the last line was
+        self._item_open = False
+        self._rows = 0
+
+    def feed(self, text):
+        # HTML for the lines `text` completes; a partial last line waits
+        if '\n' not in text:
+            self._pending.append(text)
+            return ''
+        lines = text.split('\n')
+        lines[0] = ''.join(self._pending) + lines[0]
+        self._pending = [lines.pop()]
+        return ''.join(self._line(line) for line in lines)
+
+    def close(self):
+        # HTML for whatever is left, with any open list or table closed
+        html = self._line(''.join(self._pending)) + self._end_block()
+        self._pending = []
+        self._block = None
+        return html
+
+    def _end_block(self):
+        html = '</li>' if self._item_open else ''
+        self._item_open = False
+        if self._block in ('ol', 'ul', 'table'):
+            html += f'</{self._block}>'
+        return html
+
+    def _line(self, line):
+        if ORDERED_RE.match(line):
+            return self._item('ol', line)
+        if BULLET_RE.match(line):
+            return self._item('ul', line)
+        if self._item_open and line[:1].isspace() and line.strip():
+            # Indented continuation of the current list item
+            return '<br>' + inline(line.strip())
+        cells = _cells(line)
+        if cells is not None:
+            return self._row(cells)
+
+        html = '<br>' if self._block == 'text' else self._end_block()
+        self._block = 'text'
+        return html + inline(line)
+
+    def _item(self, kind, line):
+        if self._block == kind:
+            html = '</li>'
+        else:
+            html = self._end_block() + f'<{kind}>'
+            self._block = kind
+        self._item_open = True
+        return html + '<li>' + inline(line.strip())
+
+    def _row(self, cells):
+        html = ''
+        if self._block != 'table':
+            html = self._end_block() + TABLE_OPEN
+            self._block = 'table'
+            self._rows = 0
+        elif self._rows == 1 and all(SEPARATOR_RE.fullmatch(cell) for cell in cells):
+            return ''  # the |---|---| line under the header
+        tag = 'th' if self._rows == 0 else 'td'
+        self._rows += 1
+        return html + '<tr>' + ''.join(
+            f'<{tag} class="{CELL_CLASS}">{inline(cell.strip())}</{tag}>' for cell in cells) + '</tr>'
@@ -0,0 +1,121 @@
+import hashlib
+from contextlib import closing
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+# Persistent cache of LLM answers. An answer is reused when the same model
+# is asked the same (normalized) question over the same retrieved chunks of
+# the same chat. With a similarity threshold set, a question whose embedding
+# is close enough to a cached question over that same context also hits.
+
+
+def normalize_question(text):
+    return ' '.join(text.split()).casefold()
+
+
+def context_key(model_name, chat_id, chunk_ids):
+    payload = json.dumps([model_name, chat_id, sorted(int(i) for i in chunk_ids)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def response_key(context, question):
+    return hashlib.sha256(f"{context}\0{normalize_question(question)}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, max_entries=5000, similarity=0.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.similarity = similarity  # 0 disables semantic matching
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, context TEXT NOT NULL, chat_id INTEGER NOT NULL, '
+                         'embedding BLOB, response TEXT NOT NULL, last_used REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_context ON responses (context)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_chat_id ON responses (chat_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)')
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    @property
+    def semantic(self):
+        return self.similarity > 0
+
+    def get(self, model_name, chat_id, chunk_ids, question, embedding=None):
+        context = context_key(model_name, chat_id, chunk_ids)
+        key = response_key(context, question)
+        with self._connect() as conn:
+            row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None and self.semantic and embedding is not None:
+                key, row = self._nearest(conn, context, embedding)
+                if row is not None:
+                    self.semantic_hits += 1
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        return row[0]
+
+    def _nearest(self, conn, context, embedding):
+        rows = conn.execute('SELECT key, embedding, response FROM responses '
+                            'WHERE context = ? AND embedding IS NOT NULL', (context,)).fetchall()
+        if not rows:
+            return None, None
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        cached = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows])
+        norms = np.linalg.norm(cached, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = cached @ query / np.maximum(norms, 1e-12)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None, None
+        return rows[best][0], (rows[best][2],)
+
+    def put(self, model_name, chat_id, chunk_ids, question, response, embedding=None):
+        context = context_key(model_name, chat_id, chunk_ids)
+        key = response_key(context, question)
+        blob = None
+        if embedding is not None:
+            blob = np.asarray(embedding, dtype=np.float32).ravel().tobytes()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('INSERT OR REPLACE INTO responses (key, context, chat_id, embedding, response, last_used) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', (key, context, chat_id, blob, response, time.time()))
+                count, = conn.execute('SELECT COUNT(*) FROM responses').fetchone()
+                if count > self.max_entries:
+                    conn.execute('DELETE FROM responses WHERE key IN '
+                                 '(SELECT key FROM responses ORDER BY last_used LIMIT ?)',
+                                 (count - self.max_entries,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def drop_chat(self, chat_id):
+        # Chunk ids restart from zero when a chat's index is rebuilt from
+        # nothing, so answers for it must go with the old index.
+        with self._connect() as conn:
+            conn.execute('DELETE FROM responses WHERE chat_id = ?', (chat_id,))
+
+    def stats(self):
+        with self._connect() as conn:
+            size, = conn.execute('SELECT COUNT(*) FROM responses').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Document summaries, map-reduced over a sample of the document's chunks and
+# stored by content hash, so a re-upload, a copy in another chat or a
+# restart never pays for the same summary twice.
+MAP_PROMPT = "Summarize this excerpt of the document {filename} in 2-3 sentences:\n\n{text}"
+REDUCE_PROMPT = ("Below are summaries of excerpts taken from across the document {filename}, in order. "
+                 "Combine them into a summary of the whole document in 3-5 sentences:\n\n{text}")
+SINGLE_PROMPT = "Summarize the document {filename} in 3-5 sentences:\n\n{text}"
+
+
+class SummaryStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS summaries ('
+                         'sha256 TEXT NOT NULL, model TEXT NOT NULL, summary TEXT NOT NULL, '
+                         'created REAL NOT NULL, PRIMARY KEY (sha256, model))')
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def get(self, sha256, model_name):
+        with self._connect() as conn:
+            row = conn.execute('SELECT summary FROM summaries WHERE sha256 = ? AND model = ?',
+                               (sha256, model_name)).fetchone()
+        return row[0] if row else None
+
+    def put(self, sha256, model_name, summary):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO summaries (sha256, model, summary, created) VALUES (?, ?, ?, ?)',
+                         (sha256, model_name, summary, time.time()))
+
+
+def sample_positions(count, n):
+    # Up to `n` chunk positions spread evenly from the first to the last
+    if count <= n:
+        return list(range(count))
+    return sorted(set(np.linspace(0, count - 1, n).round().astype(int).tolist()))
+
+
+class Summarizer:
+    # Map: consecutive sampled chunks are summarized `chunks_per_call` at a
+    # time, in parallel on `max_workers` threads (the LLM client still caps
+    # how many generations reach Ollama). Reduce: one call merges the
+    # partial summaries. A document that fits in one map call is summarized
+    # directly.
+    def __init__(self, generate, store, model_name, sample_chunks=8, chunks_per_call=2, max_workers=2):
+        self.generate = generate  # prompt -> text
+        self.store = store
+        self.model_name = model_name
+        self.sample_chunks = sample_chunks
+        self.chunks_per_call = chunks_per_call
+        self._jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summary')
+        self._calls = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summary-map')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, sha256):
+        return self.store.get(sha256, self.model_name)
+
+    def pending(self, sha256):
+        with self._lock:
+            return sha256 in self._pending
+
+    def submit(self, sha256, filename, chunks):
+        # Summarizes in the background unless the content is already stored
+        # or being summarized. `chunks` should already be the sample to use.
+        with self._lock:
+            if sha256 in self._pending or self.get(sha256) is not None:
+                return
+            self._pending[sha256] = self._jobs.submit(self._run, sha256, filename, list(chunks))
+
+    def _run(self, sha256, filename, chunks):
+        try:
+            with span('summarize'):
+                summary = self.summarize(filename, chunks)
+            self.store.put(sha256, self.model_name, summary)
+        except Exception:
+            logger.exception("Failed to summarize %s", filename)
+        finally:
+            with self._lock:
+                self._pending.pop(sha256, None)
+
+    def summarize(self, filename, chunks):
+        groups = ["\n".join(chunks[i:i + self.chunks_per_call])
+                  for i in range(0, len(chunks), self.chunks_per_call)]
+        if len(groups) <= 1:
+            return self.generate(SINGLE_PROMPT.format(filename=filename, text=groups[0] if groups else ''))
+        partials = list(self._calls.map(
+            lambda text: self.generate(MAP_PROMPT.format(filename=filename, text=text)), groups))
+        return self.generate(REDUCE_PROMPT.format(filename=filename, text="\n\n".join(partials)))
@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from ingest import Prefetcher
+
+
+def parsed_files(files, started):
+    # (filename, doc) pairs as parse_uploads yields them; `started` records
+    # which files the parser has begun reading
+    for name, segments in files:
+        if segments is None:
+            yield name, None
+            continue
+
+        def read(name=name, segments=segments):
+            started.append(name)
+            for segment in segments:
+                if isinstance(segment, Exception):
+                    raise segment
+                yield segment
+        yield name, {'filename': name, 'segments': read()}
+
+
+def test_next_file_is_parsed_while_the_current_one_is_read():
+    started = []
+    parsed = Prefetcher(parsed_files([('a', ['a1', 'a2']), ('b', ['b1'])], started), max_segments=8)
+    name, doc = next(parsed)
+    assert name == 'a'
+    assert next(doc['segments']) == 'a1'
+    # The consumer is still on the first file; the thread has moved on
+    for _ in range(100):
+        if started == ['a', 'b']:
+            break
+        threading.Event().wait(0.01)
+    assert started == ['a', 'b']
+    assert list(doc['segments']) == ['a2']
+    name, doc = next(parsed)
+    assert (name, list(doc['segments'])) == ('b', ['b1'])
+    with pytest.raises(StopIteration):
+        next(parsed)
+
+
+def test_abandoned_and_failed_files_do_not_leak_into_the_next():
+    files = [('a', ['a1', 'a2', 'a3']), ('skipped', None), ('bad', ['x', ValueError('corrupt')]), ('c', ['c1'])]
+    parsed = Prefetcher(parsed_files(files, []), max_segments=2)
+    _, doc = next(parsed)
+    assert next(doc['segments']) == 'a1'  # the rest of 'a' is never read
+    assert next(parsed) == ('skipped', None)
+    _, doc = next(parsed)
+    with pytest.raises(ValueError):
+        list(doc['segments'])
+    name, doc = next(parsed)
+    assert (name, list(doc['segments'])) == ('c', ['c1'])
+    parsed.close()
+
+
+def test_broken_parse_iterator_is_raised():
+    def broken():
+        yield 'a', None
+        raise OSError('disk gone')
+
+    parsed = Prefetcher(broken())
+    assert next(parsed) == ('a', None)
+    with pytest.raises(OSError):
+        next(parsed)
@@ -0,0 +1,85 @@
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import parsers
+from parsers import DocumentParser
+
+
+def make_docx(path, paragraphs, label):
+    docx = pytest.importorskip('docx')
+    document = docx.Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"{label} paragraph {i}")
+    document.save(str(path))
+    return str(path)
+
+
+def spool_files(spool_dir):
+    return [name for name in os.listdir(spool_dir) if name.startswith(parsers.SPOOL_PREFIX)]
+
+
+def test_non_pdf_files_parse_ahead_in_the_pool_and_stream_back(tmp_path):
+    spool_dir = tmp_path / 'spool'
+    spool_dir.mkdir()
+    paths = [make_docx(tmp_path / f"doc{i}.docx", 200, f"doc{i}") for i in range(4)]
+
+    parser = DocumentParser(max_workers=2, spool_dir=str(spool_dir))
+    parsed = parser.iter_parse(paths)
+    file_path, segments = next(parsed)
+    first = next(segments)
+    # The consumer is still on the first file, read back from its spool;
+    # the pool has already extracted later files into spools of their own
+    for _ in range(500):
+        if len(spool_files(spool_dir)) == 4:
+            break
+        time.sleep(0.01)
+    assert len(spool_files(spool_dir)) == 4
+    assert first + ''.join(segments) == parsers.extract_text(paths[0])
+
+    for path, (file_path, segments) in zip(paths[1:], parsed):
+        assert file_path == path
+        assert ''.join(segments) == parsers.extract_text(path)
+    assert spool_files(spool_dir) == []
+
+
+def test_spooled_segments_are_written_and_read_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(parsers, 'SPOOL_BATCH_CHARS', 100)
+    path = make_docx(tmp_path / 'document.docx', 50, 'doc')
+    spool_path = str(tmp_path / 'spool')
+
+    spooled = parsers.spool_segments(path, spool_path)
+    with open(spool_path, 'rb') as f:
+        batches = []
+        while True:
+            try:
+                batches.append(pickle.load(f))
+            except EOFError:
+                break
+    assert len(batches) > 1
+    assert all(sum(map(len, batch[:-1])) < 100 for batch in batches)
+
+    segments = iter(spooled)
+    next(segments)
+    assert os.path.exists(spool_path)
+    segments.close()  # abandoned part way: the spool is still removed
+    assert not os.path.exists(spool_path)
+
+
+def test_docx_parses_in_order(tmp_path):
+    docx = pytest.importorskip('docx')
+    document = docx.Document()
+    for i in range(50):
+        document.add_paragraph(f"paragraph {i}")
+    path = tmp_path / 'document.docx'
+    document.save(str(path))
+
+    parser = DocumentParser(max_workers=2)
+    text = parser.parse(str(path))
+    assert text == parsers.extract_text(str(path))
+    assert text.index("paragraph 1\n") < text.index("paragraph 49")
@@ -0,0 +1,643 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from lexical import LexicalIndex, postings, rrf
+from metrics import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+# Layout of a chat's index directory (uploads/<chat_id>/.index):
+#
+#   CURRENT          generation number of the live snapshot and the index's
+#                    epoch, a random id chosen when the index is created
+#   <generation>/    vectors.faiss, manifest.json, text.bin, one .npy per
+#                    metadata column and the lexical index (see lexical.py)
+#
+# Every update writes a complete new generation and then swaps CURRENT, so
+# readers in other workers never see a half-written index and can keep
+# using an old mmap until they notice the generation has moved on. Clearing
+# a chat deletes the directory and numbering starts again at 1, so a
+# snapshot is identified by its epoch and generation together.
+#
+# Vectors are stored under ids that are handed out in increasing order and
+# never reused, so the `ids` column stays sorted and a search hit maps back
+# to its chunk row with a binary search.
+#
+# The index type grows with the chat (see IndexPolicy): a flat IndexIDMap2
+# for small corpora, then IVF-Flat, then IVF-PQ, all searched by inner
+# product over normalised vectors. IVF indexes keep their own
+# ids and a hashtable direct map, so add_with_ids, remove_ids and
+# reconstruct work the same on every tier. Moving up a tier needs training,
+# which runs in a background thread and is published as a new generation.
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+INDEX_FILE = 'vectors.faiss'
+MANIFEST_FILE = 'manifest.json'
+TEXT_FILE = 'text.bin'
+SPOOL_PREFIX = '.spool-'
+SPOOL_TTL = 24 * 3600
+ADD_BATCH_SIZE = 4096
+FLAT = 'flat'
+IVF_FLAT = 'ivf_flat'
+IVF_PQ = 'ivf_pq'
+TIERS = (FLAT, IVF_FLAT, IVF_PQ)
+FLOAT32 = 'float32'
+FP16 = 'fp16'
+INT8 = 'int8'
+PQ = 'pq'
+# faiss is imported inside the functions that use it, so importing this
+# module (and the app) only pays for it once an index is actually touched.
+SQ_TYPES = {FP16: 'QT_fp16', INT8: 'QT_8bit'}  # faiss.ScalarQuantizer attributes
+INT8_MIN_RANGE = 0.35
+RECONSTRUCT_BATCH_SIZE = 65536
+COLUMNS = {'ids': np.int64, 'file_ids': np.int32, 'chunk_ids': np.int32, 'offsets': np.int64}
+# Candidates taken from each retriever before rank fusion
+HYBRID_CANDIDATES = 50
+
+logger = logging.getLogger(__name__)
+
+_cache = {}
+_cache_lock = threading.Lock()
+_write_locks = {}  # root -> [lock, holders and waiters]
+_write_locks_lock = threading.Lock()
+
+
+class ChatIndex:
+    def __init__(self, root, generation, epoch, index, manifest, columns, text, lexical=None):
+        self.root = root
+        self.generation = generation
+        self.epoch = epoch
+        self.index = index
+        self.manifest = manifest
+        self.files = manifest['files']
+        self.ids = columns['ids']
+        self.file_ids = columns['file_ids']
+        self.chunk_ids = columns['chunk_ids']
+        self.offsets = columns['offsets']
+        self.text = text
+        self.lexical = lexical
+        self._filenames = {f['file_id']: f['filename'] for f in self.files}
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal if self.index is not None else 0
+
+    def find_file(self, filename):
+        for f in self.files:
+            if f['filename'] == filename:
+                return f
+        return None
+
+    def file_positions(self, file_id):
+        # Positions of a file's chunks, in document order
+        return np.flatnonzero(self.file_ids == file_id)
+
+    def chunk(self, position):
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return {
+            'id': int(self.ids[position]),
+            'filename': self._filenames[int(self.file_ids[position])],
+            'chunk_index': int(self.chunk_ids[position]),
+            'chunk_text': bytes(self.text[start:end]).decode('utf-8'),
+        }
+
+    def chunk_by_id(self, vector_id):
+        position = int(np.searchsorted(self.ids, vector_id))
+        if position == len(self.ids) or self.ids[position] != vector_id:
+            raise KeyError(vector_id)
+        return self.chunk(position)
+
+    def search(self, query_embeddings, k=10, query_text=None):
+        # Best first, each chunk carrying its cosine similarity as `score`.
+        # Given the query text, dense and BM25 candidates are merged by
+        # reciprocal rank fusion and `score` is the fused score instead.
+        if not self.ntotal:
+            return []
+        if query_text is None or self.lexical is None:
+            with span('vector_search'):
+                D, I = self.index.search(normalized(query_embeddings), min(k, self.ntotal))
+            return [dict(self.chunk_by_id(i), score=float(d)) for d, i in zip(D[0], I[0]) if i >= 0]
+
+        candidates = max(k, HYBRID_CANDIDATES)
+        with span('vector_search'):
+            _, I = self.index.search(normalized(query_embeddings), min(candidates, self.ntotal))
+        with span('lexical_search'):
+            positions, _ = self.lexical.search(query_text, candidates)
+        dense = [int(i) for i in I[0] if i >= 0]
+        fused = rrf([dense, self.ids[positions].tolist()])
+        best = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [dict(self.chunk_by_id(i), score=fused[i]) for i in best]
+
+    def embeddings(self, vector_ids):
+        # Stored (normalised) vectors; approximate on quantized indexes
+        return self.index.reconstruct_batch(np.asarray(vector_ids, dtype=np.int64))
+
+
+class IndexPolicy:
+    # Chooses the index type for a chat from its size and builds it:
+    # Flat below `ivf_threshold` vectors, IVF-Flat up to `pq_threshold`,
+    # IVF-PQ (`pq_m` sub-quantizers of 8 bits) beyond. Every tier ranks by
+    # inner product over L2-normalised vectors, i.e. cosine similarity.
+    # `storage` picks how Flat and IVF-Flat keep their vectors: 'float32',
+    # or scalar-quantized 'fp16' / 'int8'. `nprobe` is applied to IVF
+    # indexes whenever one is loaded.
+    def __init__(self, ivf_threshold=50000, pq_threshold=500000, nprobe=16, pq_m=48, storage=FLOAT32):
+        if storage not in SQ_TYPES and storage != FLOAT32:
+            raise ValueError(f"Unknown vector storage {storage!r}")
+        self.ivf_threshold = ivf_threshold
+        self.pq_threshold = pq_threshold
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.storage = storage
+
+    def tier_for(self, ntotal):
+        if ntotal >= self.pq_threshold:
+            return IVF_PQ
+        if ntotal >= self.ivf_threshold:
+            return IVF_FLAT
+        return FLAT
+
+    def nlist_for(self, ntotal):
+        return int(min(65536, max(16, 4 * np.sqrt(ntotal))))
+
+    def spec(self, tier):
+        # (tier, metric, storage) of the index build() makes for this tier
+        import faiss
+        return tier, faiss.METRIC_INNER_PRODUCT, PQ if tier == IVF_PQ else self.storage
+
+    def target(self, index):
+        # Never drops a tier after deletions, but does rebuild when the
+        # metric or storage no longer match the configuration.
+        tier = max(self.tier_for(index.ntotal), index_spec(index)[0], key=TIERS.index)
+        return tier if index_spec(index) != self.spec(tier) else None
+
+    def build(self, tier, dim, training=None):
+        # Returns an empty index of the given tier, trained on `training`
+        # (normalised rows sampled from the corpus) when it needs training.
+        import faiss
+        metric = faiss.METRIC_INNER_PRODUCT
+        if tier == FLAT:
+            if self.storage == FLOAT32:
+                return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+            index = faiss.IndexScalarQuantizer(dim, getattr(faiss.ScalarQuantizer, SQ_TYPES[self.storage]), metric)
+            self._train(index, training)
+            return faiss.IndexIDMap2(index)
+
+        nlist = self.nlist_for(len(training))
+        quantizer = faiss.IndexFlatIP(dim)
+        if tier == IVF_PQ:
+            m = self.pq_m
+            while dim % m:
+                m -= 1  # sub-quantizers must divide the dimension
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, 8, metric)
+        elif self.storage == FLOAT32:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, getattr(faiss.ScalarQuantizer, SQ_TYPES[self.storage]), metric)
+        self._train(index, training)
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        self.prepare(index)
+        return index
+
+    def _train(self, index, training):
+        training = np.ascontiguousarray(training, dtype=np.float32)
+        if self.storage == INT8:
+            # int8 learns a per-dimension range from the training rows; pad it
+            # so a small first upload does not clamp everything that follows.
+            bound = np.full((1, training.shape[1]), INT8_MIN_RANGE, dtype=np.float32)
+            training = np.vstack([training, bound, -bound])
+        index.train(training)
+
+    def prepare(self, index):
+        import faiss
+        if index is not None and index_tier(index) != FLAT:
+            faiss.extract_index_ivf(index).nprobe = self.nprobe
+        return index
+
+
+def index_tier(index):
+    return index_spec(index)[0]
+
+
+def index_spec(index):
+    # (tier, metric, storage) of an existing index
+    import faiss
+    if isinstance(index, faiss.IndexIVF):
+        index = faiss.downcast_index(index) if type(index) is faiss.IndexIVF else index
+        if isinstance(index, faiss.IndexIVFPQ):
+            return IVF_PQ, index.metric_type, PQ
+        tier = IVF_FLAT
+    else:
+        tier = FLAT
+        index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        storage = next((name for name, qtype in SQ_TYPES.items()
+                        if getattr(faiss.ScalarQuantizer, qtype) == index.sq.qtype), None)
+    else:
+        storage = FLOAT32
+    return tier, index.metric_type, storage
+
+
+def normalized(vectors):
+    import faiss
+    vectors = np.array(vectors, dtype=np.float32)  # copy: normalize_L2 works in place
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+policy = IndexPolicy()
+
+
+def set_policy(new_policy):
+    global policy
+    policy = new_policy
+
+
+class ChunkSpool:
+    # Staging area for one document while it is being ingested: chunk text
+    # and vectors are appended batch by batch to files inside the chat's
+    # index directory, so update_documents can publish a document of any
+    # size without it ever being held in memory.
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=SPOOL_PREFIX, dir=root)
+        self.text_path = os.path.join(self.path, TEXT_FILE)
+        self.vectors_path = os.path.join(self.path, 'vectors.f32')
+        self._text = open(self.text_path, 'wb')
+        self._vectors = open(self.vectors_path, 'wb')
+        self._lengths = []
+        self.count = 0
+        self.dim = None
+
+    def append(self, chunks, embeddings):
+        encoded = [chunk.encode('utf-8') for chunk in chunks]
+        for part in encoded:
+            self._text.write(part)
+        self._vectors.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        self._lengths.append(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)))
+        self.count += len(encoded)
+        self.dim = embeddings.shape[1]
+
+    def close(self):
+        self._text.close()
+        self._vectors.close()
+
+    def lengths(self):
+        return np.concatenate(self._lengths) if self._lengths else np.empty(0, dtype=np.int64)
+
+    def iter_texts(self, batch_size=ADD_BATCH_SIZE):
+        # All chunk texts in order, `batch_size` at a time
+        lengths = self.lengths()
+        with open(self.text_path, 'rb') as f:
+            for start in range(0, len(lengths), batch_size):
+                sizes = lengths[start:start + batch_size]
+                data = f.read(int(sizes.sum()))
+                ends = np.cumsum(sizes)
+                yield [data[e - n:e].decode('utf-8') for n, e in zip(sizes.tolist(), ends.tolist())]
+
+    def texts(self, positions):
+        # Chunk texts at `positions`, read back from the closed spool
+        ends = np.cumsum(self.lengths())
+        texts = []
+        with open(self.text_path, 'rb') as f:
+            for position in positions:
+                start = int(ends[position - 1]) if position else 0
+                f.seek(start)
+                texts.append(f.read(int(ends[position]) - start).decode('utf-8'))
+        return texts
+
+    def embeddings(self):
+        if not self.count:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(self.count, self.dim))
+
+    def discard(self):
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def read_current(root):
+    # (generation, epoch) of the live snapshot, or (0, None) if there is none
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            fields = f.read().split()
+        return int(fields[0]), fields[1] if len(fields) > 1 else ''
+    except (OSError, ValueError, IndexError):
+        return 0, None
+
+
+def _read_index(path, mmap):
+    # IO_FLAG_MMAP alone still copies the codes of flat and scalar-quantized
+    # indexes (the Flat tier) into private memory; IO_FLAG_MMAP_IFC maps them
+    # too, so workers share the page cache instead of each holding a copy.
+    import faiss
+    if mmap:
+        for flag in (getattr(faiss, 'IO_FLAG_MMAP_IFC', None), faiss.IO_FLAG_MMAP):
+            if flag is None:
+                continue
+            try:
+                return faiss.read_index(path, flag)
+            except RuntimeError:
+                pass  # index type without this kind of mmap support
+    return faiss.read_index(path)
+
+
+def _load(root, generation, epoch, mmap=True):
+    gen_dir = os.path.join(root, str(generation))
+    mode = 'r' if mmap else None
+    index_path = os.path.join(gen_dir, INDEX_FILE)
+    index = policy.prepare(_read_index(index_path, mmap)) if os.path.exists(index_path) else None
+    with open(os.path.join(gen_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    columns = {name: np.load(os.path.join(gen_dir, name + '.npy'), mmap_mode=mode) for name in COLUMNS}
+    text_path = os.path.join(gen_dir, TEXT_FILE)
+    if os.path.getsize(text_path):
+        text = np.memmap(text_path, dtype=np.uint8, mode='r')
+    else:
+        text = np.empty(0, dtype=np.uint8)
+    return ChatIndex(root, generation, epoch, index, manifest, columns, text, LexicalIndex.load(gen_dir, mmap))
+
+
+def get_chat_index(root):
+    # Loaded lazily on first use; the cached copy is reused for as long as
+    # CURRENT still names its generation and epoch, so a worker only
+    # reloads after some worker has written or cleared the chat.
+    generation, epoch = read_current(root)
+    if not generation:
+        return None
+    with _cache_lock:
+        cached = _cache.get(root)
+        if cached is not None and (cached.generation, cached.epoch) == (generation, epoch):
+            return cached
+        try:
+            loaded = _load(root, generation, epoch)
+        except FileNotFoundError:
+            # A writer published and cleaned up between reading CURRENT and
+            # opening the files; the newer generation is complete by now.
+            loaded = _load(root, *read_current(root))
+        _cache[root] = loaded
+    if loaded.index is not None and policy.target(loaded.index) is not None:
+        _schedule_retier(root)  # built under an older configuration
+    return loaded
+
+
+def drop_chat_index(root):
+    with _cache_lock:
+        _cache.pop(root, None)
+
+
+class _Locked:
+    # Serialises writers to one chat's index within this process and, where
+    # flock exists, across gunicorn workers sharing the same uploads
+    # directory. Writers to different chats don't wait for each other.
+    def __init__(self, root):
+        self.root = root
+        self.handle = None
+
+    def __enter__(self):
+        with _write_locks_lock:
+            entry = _write_locks.setdefault(self.root, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            if fcntl is not None:
+                self.handle = open(os.path.join(self.root, LOCK_FILE), 'a')
+                fcntl.flock(self.handle, fcntl.LOCK_EX)
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+        with _write_locks_lock:
+            entry = _write_locks[self.root]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del _write_locks[self.root]
+
+
+def _write(root, generation, epoch, index, manifest, columns, text_parts, lexical):
+    gen_dir = os.path.join(root, str(generation))
+    if os.path.exists(gen_dir):
+        shutil.rmtree(gen_dir)
+    os.makedirs(gen_dir)
+    if index is not None:
+        import faiss
+        faiss.write_index(index, os.path.join(gen_dir, INDEX_FILE))
+    with open(os.path.join(gen_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(gen_dir, name + '.npy'), np.asarray(columns[name], dtype=dtype))
+    lexical.save(gen_dir)
+    with open(os.path.join(gen_dir, TEXT_FILE), 'wb') as f:
+        for part in text_parts:
+            if isinstance(part, str):  # a spooled text file
+                with open(part, 'rb') as src:
+                    shutil.copyfileobj(src, f)
+            else:
+                f.write(part)
+
+    tmp = os.path.join(root, CURRENT_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(f"{generation} {epoch}")
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+    # Old generations stay readable through existing mmaps after unlinking;
+    # the previous one is kept so readers that just saw it can still open it.
+    for name in os.listdir(root):
+        if name.isdigit() and int(name) < generation - 1:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        elif name.startswith(SPOOL_PREFIX):
+            # Left behind by a worker that died mid-ingest
+            path = os.path.join(root, name)
+            if os.path.getmtime(path) < time.time() - SPOOL_TTL:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _lexical(chat_index):
+    # Generations written before lexical search existed get their postings
+    # built from the stored text on the next write.
+    if chat_index.lexical is not None:
+        return chat_index.lexical
+    offsets = np.asarray(chat_index.offsets)
+    texts = (bytes(chat_index.text[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(len(offsets) - 1))
+    return LexicalIndex.from_postings(*postings(texts))
+
+
+def _doc_size(doc):
+    spool = doc.get('spool')
+    return spool.count if spool is not None else len(doc['chunks'])
+
+
+def update_documents(root, add=(), remove=()):
+    # Apply one batch of changes to a chat's index and publish it as a new
+    # generation. `remove` is a list of filenames; each doc in `add` is a
+    # dict with `filename`, `sha256` and either a ChunkSpool under
+    # `spool`, or `chunks` plus an `embeddings` float32 matrix with one row
+    # per chunk. Adding a filename that is already indexed replaces the old
+    # version. Only the changed documents touch FAISS: removals go through
+    # remove_ids, additions through add_with_ids.
+    replaced = set(remove) | {doc['filename'] for doc in add}
+    add = [doc for doc in add if _doc_size(doc)]
+    with _Locked(root):
+        generation, epoch = read_current(root)
+        current = _load(root, generation, epoch, mmap=False) if generation else None
+        if current is not None:
+            # An emptied index is rebuilt from scratch on the next addition
+            index = current.index if current.ntotal else None
+            manifest = dict(current.manifest)
+            columns = {name: np.asarray(getattr(current, name)) for name in COLUMNS}
+            text = current.text
+            lexical = _lexical(current)
+        else:
+            epoch = uuid.uuid4().hex
+            index = None
+            manifest = {'next_id': 0, 'next_file_id': 0, 'files': []}
+            columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+            columns['offsets'] = np.zeros(1, dtype=np.int64)
+            text = np.empty(0, dtype=np.uint8)
+            lexical = LexicalIndex.empty()
+
+        dropped = [f['file_id'] for f in manifest['files'] if f['filename'] in replaced]
+        if not dropped and not add:
+            return get_chat_index(root)
+        manifest['files'] = [f for f in manifest['files'] if f['file_id'] not in dropped]
+
+        if dropped:
+            mask = np.isin(columns['file_ids'], dropped)
+            index.remove_ids(np.ascontiguousarray(columns['ids'][mask]))
+            keep = ~mask
+            starts = columns['offsets'][:-1][keep]
+            ends = columns['offsets'][1:][keep]
+            text_parts = [text[s:e] for s, e in zip(starts, ends)]
+            columns = {name: columns[name][keep] for name in ('ids', 'file_ids', 'chunk_ids')}
+            columns['offsets'] = np.concatenate(([0], np.cumsum(ends - starts))).astype(np.int64)
+            lexical = lexical.compact(keep)
+        else:
+            text_parts = [text] if len(text) else []
+
+        ids, file_ids, chunk_ids = [columns['ids']], [columns['file_ids']], [columns['chunk_ids']]
+        offsets = [columns['offsets']]
+        text_size = int(columns['offsets'][-1])
+        position = len(columns['ids'])
+        lexical_parts = []
+        for doc in add:
+            spool = doc.get('spool')
+            if spool is not None:
+                embeddings = spool.embeddings()
+                lengths = spool.lengths()
+                text_parts.append(spool.text_path)
+                batches = spool.iter_texts()
+            else:
+                embeddings = np.asarray(doc['embeddings'], dtype=np.float32)
+                encoded = [chunk.encode('utf-8') for chunk in doc['chunks']]
+                lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+                text_parts.extend(encoded)
+                batches = [doc['chunks']]
+            for batch in batches:
+                lexical_parts.append(postings(batch, position))
+                position += len(batch)
+
+            if index is None:
+                index = policy.build(FLAT, embeddings.shape[1], normalized(embeddings[:RECONSTRUCT_BATCH_SIZE]))
+            doc_ids = np.arange(manifest['next_id'], manifest['next_id'] + len(lengths), dtype=np.int64)
+            for start in range(0, len(lengths), ADD_BATCH_SIZE):
+                stop = start + ADD_BATCH_SIZE
+                index.add_with_ids(normalized(embeddings[start:stop]), doc_ids[start:stop])
+            manifest['next_id'] += len(lengths)
+
+            file_id = manifest['next_file_id']
+            manifest['next_file_id'] += 1
+            manifest['files'].append({
+                'file_id': file_id,
+                'filename': doc['filename'],
+                'sha256': doc['sha256'],
+            })
+            ids.append(doc_ids)
+            file_ids.append(np.full(len(lengths), file_id, dtype=np.int32))
+            chunk_ids.append(np.arange(len(lengths), dtype=np.int32))
+            offsets.append(text_size + np.cumsum(lengths))
+            text_size += int(lengths.sum())
+
+        columns = {
+            'ids': np.concatenate(ids),
+            'file_ids': np.concatenate(file_ids),
+            'chunk_ids': np.concatenate(chunk_ids),
+            'offsets': np.concatenate(offsets),
+        }
+        _write(root, generation + 1, epoch, index, manifest, columns, text_parts, lexical.extend(lexical_parts))
+    if index is not None and policy.target(index) is not None:
+        _schedule_retier(root)
+    return get_chat_index(root)
+
+
+_retiering = set()
+_retier_lock = threading.Lock()
+
+
+def _schedule_retier(root):
+    with _retier_lock:
+        if root in _retiering:
+            return
+        _retiering.add(root)
+    threading.Thread(target=_retier, args=(root,), name='index-retier', daemon=True).start()
+
+
+def _copy_vectors(source, target, ids):
+    for start in range(0, len(ids), RECONSTRUCT_BATCH_SIZE):
+        batch = np.ascontiguousarray(ids[start:start + RECONSTRUCT_BATCH_SIZE])
+        target.add_with_ids(normalized(source.reconstruct_batch(batch)), batch)
+
+
+def _retier(root):
+    # Train an index of the tier the chat has grown into (or of the
+    # configured metric and storage) and publish it. Training and the bulk
+    # copy run on a snapshot without holding the write lock; whatever
+    # changed in the meantime is applied under the lock.
+    try:
+        snapshot = _load(root, *read_current(root), mmap=False)
+        tier = policy.target(snapshot.index)
+        ids = np.asarray(snapshot.ids)
+        if tier is None or not len(ids):
+            return
+        nlist = policy.nlist_for(len(ids))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(ids, size=min(len(ids), nlist * 64), replace=False))
+        training = normalized(snapshot.index.reconstruct_batch(np.ascontiguousarray(sample)))
+        index = policy.build(tier, snapshot.index.d, training)
+        _copy_vectors(snapshot.index, index, ids)
+
+        with _Locked(root):
+            latest = _load(root, *read_current(root), mmap=False)
+            if latest.epoch != snapshot.epoch:
+                return  # the chat was cleared meanwhile
+            if index_spec(latest.index) == policy.spec(tier):
+                return  # another worker got there first
+            latest_ids = np.asarray(latest.ids)
+            removed = np.setdiff1d(ids, latest_ids, assume_unique=True)
+            if len(removed):
+                index.remove_ids(removed)
+            _copy_vectors(latest.index, index, np.setdiff1d(latest_ids, ids, assume_unique=True))
+            columns = {name: np.asarray(getattr(latest, name)) for name in COLUMNS}
+            _write(root, latest.generation + 1, latest.epoch, index, latest.manifest, columns, [latest.text], _lexical(latest))
+    except Exception:
+        logger.exception("Failed to rebuild the vector index in %s", root)
+    finally:
+        with _retier_lock:
+            _retiering.discard(root)